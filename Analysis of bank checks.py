@@ -1,19 +1,121 @@
-import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, simpledialog
+try:
+    import tkinter as tk
+    from tkinter import ttk, filedialog, messagebox, simpledialog
+except ImportError:  # headless servers without Tk
+    tk = ttk = filedialog = messagebox = simpledialog = None
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # only needed for the Parquet archive
+    pa = pq = None
 import pandas as pd
+import argparse
+import glob
+import sys
 import re
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal, ROUND_HALF_UP
 import os
 import sqlite3
 import hashlib
+import queue
+import threading
+import time
+import json
+import tempfile
+import io
+import cProfile
+import pstats
+import tracemalloc
+import shutil
+import subprocess
+import zlib
+from copy import copy
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import closing, contextmanager
 from openpyxl import Workbook
-from openpyxl.styles import Font, PatternFill, Alignment, Border, Side
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, PatternFill, Alignment, Border, Side, NamedStyle
 from openpyxl.utils import get_column_letter
 
 
+NON_DIGIT_RE = re.compile(r'\D')
+DIGITS_RE = re.compile(r'\d+')
+DOTTED_DATE_RE = re.compile(r'\d{1,2}\.\d{1,2}\.\d{4}')
+ISO_DATE_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+ISO_MONTH_RE = re.compile(r'(\d{4})-(\d{1,2})$')
+PATTERN_FLAGS = re.IGNORECASE | re.MULTILINE
+WHITESPACE_RE = re.compile(r'\s+')
+PATTERN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bank_patterns')
+
+
 class ReceiptAnalyzer:
-    def __init__(self):
+    PARSER_VERSION = 4
+    DEFAULT_BANK = 'sber'
+    # The first marker is the issuing bank's header and outweighs mentions of the recipient's bank below it
+    HEADER_WEIGHT = 3
+    REQUIRED_ENTITIES = ('sender', 'amount', 'date')
+    BANK_MARKERS = {
+        'sber': ['сбербанк', 'сбер', 'sberbank', 'sber'],
+        'tinkoff': ['тинькофф', 'tinkoff', 'т-банк', 'тбанк', 'tbank'],
+        'vtb': ['втб', 'vtb'],
+        'alfa': ['альфа-банк', 'альфа банк', 'альфабанк', 'alfa-bank', 'alfabank'],
+    }
+
+    def __init__(self, pattern_dir=PATTERN_DIR):
+        # Built-in Sber patterns; other banks' packs are read and compiled on first use
         self.learned_patterns = self.load_patterns()
+        self.compiled_patterns = self.compile_patterns(self.learned_patterns)
+        self.pattern_files = self.discover_pattern_packs(pattern_dir)
+        self.bank_markers = self.load_bank_markers()
+        self.marker_regex, self.marker_banks = self.build_marker_matcher(self.bank_markers)
+
+    def discover_pattern_packs(self, pattern_dir):
+        if not pattern_dir or not os.path.isdir(pattern_dir):
+            return {}
+        return {
+            os.path.splitext(os.path.basename(path))[0]: path
+            for path in sorted(glob.glob(os.path.join(pattern_dir, '*.json')))
+        }
+
+    def read_pattern_pack(self, bank):
+        try:
+            with open(self.pattern_files[bank], encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Pattern pack error ({bank}): {e}")
+            return {}
+
+    def load_bank_markers(self):
+        markers = {bank: list(words) for bank, words in self.BANK_MARKERS.items()}
+        for bank in self.pattern_files:
+            if bank not in markers:
+                # Packs for banks without built-in markers must list their own
+                markers[bank] = self.read_pattern_pack(bank).get('markers', [])
+        return markers
+
+    def build_marker_matcher(self, bank_markers):
+        # One alternation over every marker, longest first, so a single pass finds all of them
+        marker_banks = {}
+        for bank, words in bank_markers.items():
+            for word in words:
+                marker_banks.setdefault(word.lower(), bank)
+        if not marker_banks:
+            return None, marker_banks
+        alternation = '|'.join(re.escape(word) for word in sorted(marker_banks, key=len, reverse=True))
+        return re.compile(alternation, re.IGNORECASE), marker_banks
+
+    def patterns_for(self, bank):
+        if bank not in self.compiled_patterns:
+            patterns = self.read_pattern_pack(bank).get('patterns') if bank in self.pattern_files else None
+            if patterns:
+                self.learned_patterns[bank] = patterns
+                self.compiled_patterns.update(self.compile_patterns({bank: patterns}))
+            else:
+                self.compiled_patterns[bank] = self.compiled_patterns[self.DEFAULT_BANK]
+                self.learned_patterns[bank] = self.learned_patterns[self.DEFAULT_BANK]
+        return self.compiled_patterns[bank]
 
     def load_patterns(self):
         patterns = {
@@ -47,32 +149,83 @@ class ReceiptAnalyzer:
                     r'Счёт отправителя[^\d]*[\*]*\s*(\d{4})',
                     r'Номер карты получателя[^\d]*[\*]*\s*(\d{4})',
                     r'отправителя[^\d]*[\*]*\s*(\d{4})'
+                ],
+                'operation': [
+                    r'Номер документа[:\s№]*(\d+)',
+                    r'Номер операции[:\s№]*([\w\-]+)',
+                    r'Код авторизации[:\s]*(\d+)'
                 ]
             }
         }
         return patterns
 
+    def compile_patterns(self, patterns):
+        return {
+            bank: [(entity_type, [re.compile(pattern, PATTERN_FLAGS) for pattern in pattern_list])
+                   for entity_type, pattern_list in entity_patterns.items()]
+            for bank, entity_patterns in patterns.items()
+        }
+
     def detect_bank(self, text):
-        text_lower = text.lower()
-        if any(word in text_lower for word in ['сбер', 'sber']):
-            return 'sber'
-        else:
-            return 'sber'
+        # The bank with the highest weighted marker count wins; ties go to the first one named, which is
+        # the issuing bank's header rather than the recipient's bank further down
+        if self.marker_regex is None:
+            return self.DEFAULT_BANK
+        scores = {}
+        for position, match in enumerate(self.marker_regex.finditer(text)):
+            bank = self.marker_banks[match.group(0).lower()]
+            weight = self.HEADER_WEIGHT if position == 0 else 1
+            count, first = scores.get(bank, (0, position))
+            scores[bank] = (count + weight, first)
+        if not scores:
+            return self.DEFAULT_BANK
+        return min(scores, key=lambda bank: (-scores[bank][0], scores[bank][1]))
+
+    def has_required_entities(self, text):
+        extracted = self.match_entities_with_fallback(text, self.detect_bank(text))
+        return ('sender' in extracted or 'receiver' in extracted) and 'amount' in extracted and 'date' in extracted
+
+    def match_entities(self, text, bank):
+        extracted = {'bank': bank}
 
-    def extract_entities(self, text):
-        bank = self.detect_bank(text)
-        patterns = self.learned_patterns.get(bank, {})
+        for entity_type, regexes in self.patterns_for(bank):
+            for regex in regexes:
+                match = regex.search(text)
+                if match:
+                    extracted[entity_type] = (match.group(1) if regex.groups else match.group(0)).strip()
+                    break
+
+        return extracted
+
+    def match_entities_with_fallback(self, text, bank, match=None):
+        match = match or self.match_entities
+        extracted = match(text, bank)
+        if bank != self.DEFAULT_BANK and any(entity not in extracted for entity in self.REQUIRED_ENTITIES):
+            # A misdetected bank or an unfamiliar layout: fill the gaps from the default pack
+            for entity, value in match(text, self.DEFAULT_BANK).items():
+                extracted.setdefault(entity, value)
+        return extracted
+
+    def match_entities_uncompiled(self, text, bank):
         extracted = {'bank': bank}
 
-        for entity_type, pattern_list in patterns.items():
+        self.patterns_for(bank)
+        for entity_type, pattern_list in self.learned_patterns[bank].items():
             for pattern in pattern_list:
-                matches = re.findall(pattern, text, re.IGNORECASE | re.MULTILINE)
+                matches = re.findall(pattern, text, PATTERN_FLAGS)
                 if matches:
                     extracted[entity_type] = matches[0].strip()
                     break
 
+        return extracted
+
+    def extract_entities(self, text, compiled=True):
+        bank = self.detect_bank(text)
+        extracted = self.match_entities_with_fallback(
+            text, bank, self.match_entities if compiled else self.match_entities_uncompiled)
+
         if 'amount' in extracted:
-            amount_str = extracted['amount'].replace(' ', '').replace(',', '.')
+            amount_str = WHITESPACE_RE.sub('', extracted['amount']).replace(',', '.')
             try:
                 extracted['amount'] = float(amount_str)
             except ValueError:
@@ -94,7 +247,7 @@ class ReceiptAnalyzer:
     def normalize_phone(self, phone):
         if not phone:
             return ""
-        phone = re.sub(r'\D', '', phone)
+        phone = NON_DIGIT_RE.sub('', phone)
         if phone.startswith('+7'):
             phone = '8' + phone[2:]
         elif phone.startswith('7'):
@@ -113,13 +266,14 @@ class ReceiptAnalyzer:
             for ru_month, num_month in month_map.items():
                 if ru_month in date_str.lower():
                     date_str = date_str.replace(ru_month, num_month)
-                    parts = re.findall(r'\d+', date_str)
+                    parts = DIGITS_RE.findall(date_str)
                     if len(parts) == 3:
                         day, month, year = parts
                         return f"{int(day):02d}.{int(month):02d}.{year}"
 
-            if re.match(r'\d{1,2}\.\d{1,2}\.\d{4}', date_str):
-                return date_str
+            if DOTTED_DATE_RE.match(date_str):
+                day, month, year = DIGITS_RE.findall(date_str)[:3]
+                return f"{int(day):02d}.{int(month):02d}.{year}"
 
         except Exception as e:
             print(f"Date parsing error: {e}")
@@ -127,16 +281,1010 @@ class ReceiptAnalyzer:
         return datetime.now().strftime('%d.%m.%Y')
 
 
-class AccountingWorkOptimizer:
+def iso_date(value):
+    # Payments store dates as YYYY-MM-DD so they sort and range-scan as text; receipts say DD.MM.YYYY
+    if isinstance(value, (datetime, date)):
+        return value.strftime('%Y-%m-%d')
+    text = str(value or '').strip()
+    match = ISO_DATE_RE.match(text)
+    if match:
+        year, month, day = match.groups()
+    elif DOTTED_DATE_RE.match(text):
+        day, month, year = DIGITS_RE.findall(text)[:3]
+    else:
+        return None
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def to_kopecks(amount):
+    # Amounts are stored as integer kopecks; Decimal keeps 0.285 rub. from rounding down to 28
+    if amount is None:
+        return None
+    return int((Decimal(str(amount)) * 100).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def compress_text(text):
+    return zlib.compress(text.encode('utf-8'), 6)
+
+
+def decompress_text(body):
+    return zlib.decompress(body).decode('utf-8') if body is not None else None
+
+
+FIO_SEPARATOR_RE = re.compile(r'[^\w]+|_')
+NON_WORD_RE = re.compile(r'[\W_]+')
+
+
+def fold_text(value):
+    # SQLite's lower() and LIKE only fold ASCII; searches over Cyrillic names go through this
+    if isinstance(value, str):
+        return value.lower().replace("ё", "е")
+    return value
+
+
+def normalize_fio(fio):
+    return " ".join(sorted(FIO_SEPARATOR_RE.sub(" ", fold_text(fio or "")).split()))
+
+
+def fio_trigrams(normalized_fio):
+    padded = f"  {normalized_fio} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+INITIALS_SCORE = 0.9
+INITIALS_MIN_WORD = 3
+
+
+def initials_match(tokens, other_tokens):
+    # "петров и с" matches "петров иван сергеевич": the shorter name has at least two tokens, each equal to,
+    # or the initial of, a distinct token of the longer one, and a surname-length word in common.
+    # A lone "иван" or "сергеевич" names nobody in particular and never matches
+    if len(tokens) > len(other_tokens):
+        tokens, other_tokens = other_tokens, tokens
+    if len(tokens) < 2:
+        return False
+    remaining = list(other_tokens)
+    full_match = False
+    for token in sorted(tokens, key=len, reverse=True):
+        for candidate in remaining:
+            if token == candidate or (len(token) == 1 and candidate.startswith(token)):
+                full_match = full_match or len(token) >= INITIALS_MIN_WORD
+                remaining.remove(candidate)
+                break
+        else:
+            return False
+    return full_match
+
+
+def account_suffix(account):
+    digits = NON_DIGIT_RE.sub('', account or '')
+    return digits[-4:]
+
+
+# Receipt text used to be stored cut to this many characters, often before the account and operation number
+LEGACY_TEXT_LIMIT = 500
+
+
+def receipt_fingerprint(extracted, legacy=False):
+    # A transfer re-exported or printed again keeps its payer, amount, date, account and operation number
+    # but not its file bytes; None when the receipt lacks a name, amount or date to key on.
+    # legacy: key on name, amount and date only, as receipts stored truncated are fingerprinted
+    fio = normalize_fio(extracted.get('fio'))
+    payment_date = iso_date(extracted.get('date'))
+    if not (fio and payment_date and extracted.get('amount')):
+        return None
+    fields = [fio, str(to_kopecks(extracted['amount'])), payment_date]
+    if not legacy:
+        fields += [account_suffix(extracted.get('account')),
+                   NON_WORD_RE.sub('', str(extracted.get('operation') or '')).upper()]
+    return hashlib.blake2b('\x1f'.join(fields).encode('utf-8'), digest_size=16).hexdigest()
+
+
+class ClientIndex:
+    def __init__(self, threshold=0.85):
+        self.threshold = threshold
+        self.clients = {}
+        self.by_fio = {}
+        self.by_phone = {}
+        self.by_account = {}
+        self.by_trigram = {}
+
+    def load(self, rows):
+        for row in rows:
+            self.add(*row)
+        return self
+
+    def add(self, client_id, fio, phone, account, total_debt):
+        key = normalize_fio(fio)
+        trigrams = fio_trigrams(key)
+        suffix = account_suffix(account)
+        self.clients[client_id] = (key, phone or "", suffix, total_debt, trigrams)
+        self.by_fio.setdefault(key, []).append(client_id)
+        if phone:
+            self.by_phone.setdefault(phone, []).append(client_id)
+        if suffix:
+            self.by_account.setdefault(suffix, []).append(client_id)
+        for trigram in trigrams:
+            self.by_trigram.setdefault(trigram, set()).add(client_id)
+
+    def compatible(self, client_id, phone, suffix):
+        _, client_phone, client_suffix, _, _ = self.clients[client_id]
+        return ((not phone or not client_phone or client_phone == phone)
+                and (not suffix or not client_suffix or client_suffix == suffix))
+
+    def matched_identifiers(self, client_id, phone, suffix):
+        _, client_phone, client_suffix, _, _ = self.clients[client_id]
+        return (bool(phone) and client_phone == phone) + (bool(suffix) and client_suffix == suffix)
+
+    def similarity(self, key, trigrams, client_id):
+        client_key, _, _, _, client_trigrams = self.clients[client_id]
+        if initials_match(key.split(), client_key.split()):
+            # Scored like any other candidate, so a --match-threshold above it turns the rule off
+            return INITIALS_SCORE
+        return 2 * len(trigrams & client_trigrams) / (len(trigrams) + len(client_trigrams))
+
+    def resolve(self, fio, phone="", account=""):
+        key = normalize_fio(fio)
+        suffix = account_suffix(account)
+
+        exact = [client_id for client_id in self.by_fio.get(key, ())
+                 if self.compatible(client_id, phone, suffix)]
+        if not exact:
+            trigrams = fio_trigrams(key)
+            shared = {}
+            for trigram in trigrams:
+                for client_id in self.by_trigram.get(trigram, ()):
+                    shared[client_id] = shared.get(client_id, 0) + 1
+            for identifiers in (self.by_phone.get(phone, ()) if phone else (),
+                                self.by_account.get(suffix, ()) if suffix else ()):
+                for client_id in identifiers:
+                    shared.setdefault(client_id, 0)
+
+            candidates = sorted(shared, key=shared.get, reverse=True)[:50]
+            ranked = sorted(((self.matched_identifiers(client_id, phone, suffix),
+                              self.similarity(key, trigrams, client_id), client_id)
+                             for client_id in candidates if self.compatible(client_id, phone, suffix)),
+                            reverse=True)
+            ranked = [entry for entry in ranked if entry[1] >= self.threshold]
+            # A fuzzy match only decides for a single best client: "Иван Сергеевич П." against both
+            # Петров and Павлов is left to the pending queue or the prompt rather than booked to either
+            if not ranked or (len(ranked) > 1 and ranked[0][:2] == ranked[1][:2]):
+                return None
+            client_id = ranked[0][2]
+            return client_id, self.clients[client_id][3]
+
+        client_id = min(exact, key=lambda client_id: (-self.matched_identifiers(client_id, phone, suffix),
+                                                     client_id))
+        return client_id, self.clients[client_id][3]
+
+
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def new_hasher(algorithm):
+    if algorithm == 'blake2b':
+        return hashlib.blake2b(digest_size=32)
+    if algorithm == 'xxh3':
+        import xxhash
+        return xxhash.xxh3_128()
+    return hashlib.new(algorithm)
+
+
+def fingerprint_file(file_path, algorithm='blake2b'):
+    try:
+        hasher = new_hasher(algorithm)
+        buffer = bytearray(HASH_BUFFER_SIZE)
+        view = memoryview(buffer)
+        with open(file_path, 'rb', buffering=0) as f:
+            while True:
+                read = f.readinto(buffer)
+                if not read:
+                    break
+                hasher.update(view[:read])
+        return hasher.hexdigest()
+    except Exception as e:
+        print(f"Hash calculation error: {e}")
+        return None
+
+
+def extraction_job(job):
+    pdf_path, algorithm, max_pages, stop_early = job
+    file_hash = fingerprint_file(pdf_path, algorithm) if algorithm else None
+    return file_hash, read_pdf_text(pdf_path, max_pages, stop_early)
+
+
+def iter_pdf_pages(pdf_path, max_pages=None):
+    # Yields (text, more) pairs; `more` is False for the last page that will be read
+    import PyPDF2
+
+    with open(pdf_path, 'rb') as file:
+        reader = PyPDF2.PdfReader(file)
+        page_count = len(reader.pages)
+        if max_pages is not None:
+            page_count = min(page_count, max_pages)
+        for number in range(page_count):
+            yield reader.pages[number].extract_text() or "", number + 1 < page_count
+
+
+# One analyzer per extraction process, built on first use
+page_analyzer = None
+
+
+def receipt_fields_complete(text):
+    global page_analyzer
+    if page_analyzer is None:
+        page_analyzer = ReceiptAnalyzer()
+    return page_analyzer.has_required_entities(text)
+
+
+def read_pdf_text(pdf_path, max_pages=None, stop_early=False):
+    # stop_early: stop reading pages once fio, amount and date can all be found in the text so far
+    import PyPDF2
+
+    pages = []
+    try:
+        for page_text, more in iter_pdf_pages(pdf_path, max_pages):
+            if not page_text:
+                continue
+            pages.append(page_text)
+            # Parsing to decide whether to stop only pays off when another page is left to skip
+            if stop_early and more and receipt_fields_complete("\n".join(pages)):
+                break
+        return "".join(page + "\n" for page in pages)
+    except Exception as e:
+        print(f"Text extraction error: {e}")
+        return ""
+
+
+class OcrEngine:
+    # Scanned receipts have no text layer; pages are rendered with pdftoppm and read by tesseract.
+    # Both run as subprocesses, so a small thread pool bounds the concurrent OCR jobs.
+    def __init__(self, workers=2, languages="rus+eng", page_timeout=60, max_pages=3, dpi=300, metrics=None):
+        self.workers = workers
+        self.languages = languages
+        self.page_timeout = page_timeout
+        self.max_pages = max_pages
+        self.dpi = dpi
+        self.metrics = metrics
+        self.pool = None
+        self.pending = set()
+
+    @staticmethod
+    def available():
+        return shutil.which('tesseract') is not None and shutil.which('pdftoppm') is not None
+
+    def submit(self, pdf_path):
+        if self.pool is None:
+            self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="ocr")
+        future = self.pool.submit(self.recognize, pdf_path)
+        self.pending.add(future)
+        future.add_done_callback(self.pending.discard)
+        return future
+
+    def run(self, command):
+        return subprocess.run(command, capture_output=True, timeout=self.page_timeout)
+
+    def recognize(self, pdf_path):
+        started = time.perf_counter()
+        pages = []
+        with tempfile.TemporaryDirectory(prefix="ocr_") as workdir:
+            for number in range(1, self.max_pages + 1):
+                prefix = os.path.join(workdir, f"page{number}")
+                try:
+                    rendered = self.run(['pdftoppm', '-f', str(number), '-l', str(number), '-r', str(self.dpi),
+                                         '-gray', '-png', '-singlefile', pdf_path, prefix])
+                    if rendered.returncode != 0 or not os.path.exists(prefix + ".png"):
+                        break  # past the last page
+                    recognized = self.run(['tesseract', prefix + ".png", 'stdout', '-l', self.languages])
+                except subprocess.TimeoutExpired:
+                    print(f"OCR timeout: {os.path.basename(pdf_path)} page {number}")
+                    if self.metrics is not None:
+                        self.metrics.increment('errors', stage='ocr')
+                    continue
+                except OSError as e:
+                    print(f"OCR error: {e}")
+                    break
+
+                page_text = recognized.stdout.decode('utf-8', errors='replace').strip()
+                if page_text:
+                    pages.append(page_text)
+                    if number < self.max_pages and receipt_fields_complete("\n".join(pages)):
+                        break
+
+        if self.metrics is not None:
+            self.metrics.observe('ocr', time.perf_counter() - started)
+        return "".join(page + "\n" for page in pages)
+
+    def shutdown(self):
+        if self.pool is not None:
+            # Queued pages are dropped by hand; shutdown(cancel_futures=True) needs Python 3.9
+            for future in list(self.pending):
+                future.cancel()
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+
+class ParallelExtractor:
+    def __init__(self, max_workers=None, chunksize=4, min_batch=2):
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.chunksize = max(1, chunksize)
+        self.min_batch = min_batch
+
+    def should_parallelize(self, items):
+        return self.max_workers > 1 and len(items) >= self.min_batch
+
+    def map(self, function, items):
+        items = list(items)
+        done = 0
+        if self.should_parallelize(items):
+            executor = ProcessPoolExecutor(max_workers=min(self.max_workers, len(items)))
+            results = None
+            try:
+                results = executor.map(function, items, chunksize=self.chunksize)
+                for result in results:
+                    yield result
+                    done += 1
+                return
+            except (OSError, RuntimeError) as e:
+                # Pool could not start or a worker died; finish the rest in-process
+                print(f"Parallel extraction error: {e}")
+            finally:
+                # Closing the map iterator cancels chunks not yet started, so a caller that
+                # stops early does not wait for them (shutdown(cancel_futures=True) needs 3.9)
+                if results is not None:
+                    results.close()
+                executor.shutdown(wait=True)
+
+        for item in items[done:]:
+            yield function(item)
+
+
+class DatabaseConnectionManager:
+    def __init__(self, db_file, synchronous="NORMAL", cache_size=-64000,
+                 mmap_size=256 * 1024 * 1024, busy_timeout=5000):
+        self.db_file = db_file
+        self.synchronous = synchronous
+        self.cache_size = cache_size
+        self.mmap_size = mmap_size
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = []
+
+    def _open(self):
+        conn = sqlite3.connect(self.db_file, isolation_level=None, check_same_thread=False)
+        # Set before the journal-mode switch, which is the first statement to need the lock
+        conn.execute(f"PRAGMA busy_timeout = {int(self.busy_timeout)}")
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute(f"PRAGMA synchronous = {self.synchronous}")
+        conn.execute(f"PRAGMA cache_size = {int(self.cache_size)}")
+        conn.execute(f"PRAGMA mmap_size = {int(self.mmap_size)}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        conn.execute("PRAGMA foreign_keys = ON")
+        conn.create_function("fold", 1, fold_text, deterministic=True)
+        conn.create_function("iso_date", 1, iso_date, deterministic=True)
+        conn.create_function("kopecks", 1, to_kopecks, deterministic=True)
+        conn.create_function("inflate", 1, decompress_text, deterministic=True)
+        return conn
+
+    def connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._lock:
+                self._connections.append(conn)
+        return conn
+
+    @contextmanager
+    def transaction(self):
+        conn = self.connect()
+        if self._local.depth:
+            self._local.depth += 1
+            try:
+                yield conn
+            finally:
+                self._local.depth -= 1
+            return
+
+        # Only claim the depth once BEGIN succeeds, or a "database is locked" failure would leave later
+        # transactions on this thread running as nested ones with no BEGIN/COMMIT
+        conn.execute("BEGIN IMMEDIATE")
+        self._local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._local.depth = 0
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                if conn in self._connections:
+                    self._connections.remove(conn)
+            conn.close()
+            self._local.conn = None
+
+    def close_all(self):
+        with self._lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+        self._local = threading.local()
+
+
+class FileFingerprinter:
+    def __init__(self, db, algorithm='blake2b', size_filter=True):
+        self.db = db
+        self.algorithm = algorithm
+        self.size_filter = size_filter
+        self.hash_function = partial(fingerprint_file, algorithm=algorithm)
+        self._seen_sizes = None
+
+    def stat(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except OSError as e:
+            print(f"Hash calculation error: {e}")
+            return None
+        return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+    def lookup(self, signature):
+        row = self.db.connect().execute('''
+            SELECT file_hash FROM file_fingerprints
+            WHERE path = ? AND size = ? AND mtime_ns = ? AND algorithm = ?
+        ''', (*signature, self.algorithm)).fetchone()
+        return row[0] if row else None
+
+    def seen_sizes(self):
+        if self._seen_sizes is None:
+            self._seen_sizes = {row[0] for row in self.db.connect().execute(
+                'SELECT DISTINCT size FROM file_fingerprints')}
+        return self._seen_sizes
+
+    def may_be_known(self, size):
+        # A size we have never fingerprinted cannot belong to an ingested or cached file
+        return not self.size_filter or size in self.seen_sizes()
+
+    def remember(self, entries):
+        entries = [(*signature, file_hash) for signature, file_hash in entries if signature and file_hash]
+        if not entries:
+            return
+        with self.db.transaction() as conn:
+            conn.executemany('''
+                INSERT OR REPLACE INTO file_fingerprints (path, size, mtime_ns, algorithm, file_hash)
+                VALUES (?, ?, ?, ?, ?)
+            ''', [(path, size, mtime_ns, self.algorithm, file_hash) for path, size, mtime_ns, file_hash in entries])
+        self.seen_sizes().update(size for _, size, _, _ in entries)
+
+    def fingerprint(self, file_path):
+        signature = self.stat(file_path)
+        if signature is None:
+            return None
+        file_hash = self.lookup(signature)
+        if file_hash is None:
+            file_hash = self.hash_function(file_path)
+            self.remember([(signature, file_hash)])
+        return file_hash
+
+
+class ExtractionCache:
+    # 2: text is stored with the page cap and early-stop setting it was read with
+    EXTRACTOR_VERSION = 2
+
+    def __init__(self, cache_file, max_bytes=256 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.db = DatabaseConnectionManager(cache_file, synchronous="OFF")
+        with self.db.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS extraction_cache (
+                    file_hash TEXT PRIMARY KEY,
+                    extractor_version INTEGER NOT NULL,
+                    text TEXT NOT NULL,
+                    parser_version INTEGER,
+                    entities TEXT,
+                    size INTEGER NOT NULL,
+                    last_used REAL NOT NULL,
+                    settings TEXT NOT NULL DEFAULT ''
+                )
+            ''')
+            # Caches written before EXTRACTOR_VERSION 2 lack the column; their rows never match
+            columns = {row[1] for row in conn.execute('PRAGMA table_info(extraction_cache)')}
+            if 'settings' not in columns:
+                conn.execute("ALTER TABLE extraction_cache ADD COLUMN settings TEXT NOT NULL DEFAULT ''")
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_extraction_cache_last_used ON extraction_cache (last_used)')
+        self.total_bytes = self.db.connect().execute(
+            'SELECT COALESCE(SUM(size), 0) FROM extraction_cache').fetchone()[0]
+        self.hits = 0
+        self.misses = 0
+
+    def get_text(self, file_hash, settings=''):
+        # A lazy or page-capped read is a prefix of the file's text, so it only answers a run
+        # that would read the same pages
+        row = self.db.connect().execute(
+            'SELECT text FROM extraction_cache WHERE file_hash = ? AND extractor_version = ? AND settings = ?',
+            (file_hash, self.EXTRACTOR_VERSION, settings)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.touch(file_hash)
+        return row[0]
+
+    def get_entities(self, file_hash, parser_version):
+        row = self.db.connect().execute(
+            'SELECT entities FROM extraction_cache WHERE file_hash = ? AND parser_version = ?',
+            (file_hash, parser_version)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return json.loads(row[0])
+
+    def touch(self, file_hash):
+        with self.db.transaction() as conn:
+            conn.execute('UPDATE extraction_cache SET last_used = ? WHERE file_hash = ?', (time.time(), file_hash))
+
+    def put_text(self, file_hash, text, settings=''):
+        size = len(text.encode('utf-8'))
+        with self.db.transaction() as conn:
+            old = conn.execute('SELECT size FROM extraction_cache WHERE file_hash = ?', (file_hash,)).fetchone()
+            conn.execute('''
+                INSERT OR REPLACE INTO extraction_cache
+                    (file_hash, extractor_version, text, parser_version, entities, size, last_used, settings)
+                VALUES (?, ?, ?, NULL, NULL, ?, ?, ?)
+            ''', (file_hash, self.EXTRACTOR_VERSION, text, size, time.time(), settings))
+            self.total_bytes += size - (old[0] if old else 0)
+            if self.total_bytes > self.max_bytes:
+                self.evict(conn)
+
+    def put_entities(self, file_hash, parser_version, entities):
+        payload = json.dumps(entities, ensure_ascii=False)
+        with self.db.transaction() as conn:
+            cursor = conn.execute('''
+                UPDATE extraction_cache SET parser_version = ?, entities = ?, size = size + ?
+                WHERE file_hash = ? AND entities IS NULL
+            ''', (parser_version, payload, len(payload), file_hash))
+            if cursor.rowcount:
+                self.total_bytes += len(payload)
+            else:
+                conn.execute('''
+                    UPDATE extraction_cache SET parser_version = ?, entities = ? WHERE file_hash = ?
+                ''', (parser_version, payload, file_hash))
+
+    def evict(self, conn):
+        # Drop least recently used entries until the cache is back under 90% of its budget
+        target = self.max_bytes * 0.9
+        stale = []
+        cursor = conn.execute('SELECT file_hash, size FROM extraction_cache ORDER BY last_used')
+        for file_hash, size in cursor:
+            if self.total_bytes <= target:
+                break
+            stale.append((file_hash,))
+            self.total_bytes -= size
+        cursor.close()
+        conn.executemany('DELETE FROM extraction_cache WHERE file_hash = ?', stale)
+
+    def clear(self):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM extraction_cache')
+        self.total_bytes = 0
+
+    def close(self):
+        self.db.close_all()
+
+
+class PipelineMetrics:
+    STAGES = ('hash', 'extract', 'ocr', 'parse', 'dedup', 'resolve', 'insert', 'balance')
+    BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+    OUTCOMES = (("✅", 'ok'), ("⏭️", 'duplicate'), ("⏳", 'pending'), ("⏸️", 'skipped'),
+                ("🚫", 'cancelled'), ("❌", 'failed'))
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # stage -> [calls, items, total seconds, max seconds, bucket counts]
+            self.timers = {}
+            self.counters = {}
+
+    def observe(self, stage, seconds, items=1):
+        with self.lock:
+            timer = self.timers.get(stage)
+            if timer is None:
+                timer = self.timers[stage] = [0, 0, 0.0, 0.0, [0] * len(self.BUCKETS)]
+            timer[0] += 1
+            timer[1] += items
+            timer[2] += seconds
+            timer[3] = max(timer[3], seconds)
+            for position, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    timer[4][position] += 1
+                    break
+
+    @contextmanager
+    def time(self, stage, items=1):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - started, items)
+
+    def increment(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def record_result(self, result):
+        for prefix, outcome in self.OUTCOMES:
+            if result.startswith(prefix):
+                self.increment('results', outcome=outcome)
+                return
+        self.increment('results', outcome='other')
+
+    def snapshot(self):
+        with self.lock:
+            stages = {}
+            for stage, (calls, items, total, longest, buckets) in self.timers.items():
+                stages[stage] = {
+                    'calls': calls,
+                    'items': items,
+                    'seconds': round(total, 6),
+                    'max_seconds': round(longest, 6),
+                    'ms_per_item': round(total / items * 1000, 3) if items else None,
+                    'buckets': dict(zip([str(bound) for bound in self.BUCKETS], buckets)),
+                }
+            counters = [dict(name=name, value=value, **dict(labels))
+                        for (name, labels), value in sorted(self.counters.items())]
+        return {'stages': stages, 'counters': counters}
+
+    def to_json(self):
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self, prefix='receipts'):
+        lines = [f"# TYPE {prefix}_stage_seconds histogram"]
+        with self.lock:
+            for stage, (calls, items, total, _, buckets) in sorted(self.timers.items()):
+                cumulative = 0
+                for bound, count in zip(self.BUCKETS, buckets):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {calls}')
+                lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {total:.6f}')
+                lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {calls}')
+            lines.append(f"# TYPE {prefix}_stage_items_total counter")
+            for stage, (_, items, _, _, _) in sorted(self.timers.items()):
+                lines.append(f'{prefix}_stage_items_total{{stage="{stage}"}} {items}')
+            declared = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in declared:
+                    declared.add(name)
+                    lines.append(f"# TYPE {prefix}_{name}_total counter")
+                label_text = ",".join(f'{key}="{label}"' for key, label in labels)
+                lines.append(f"{prefix}_{name}_total{{{label_text}}} {value}" if label_text
+                             else f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        stages = self.snapshot()['stages']
+        return [
+            f"{stage:<8} {stages[stage]['seconds']:>9.3f} s  {stages[stage]['items']:>7} items  "
+            f"{stages[stage]['ms_per_item'] or 0:>8.3f} ms/item  max {stages[stage]['max_seconds'] * 1000:.1f} ms"
+            for stage in self.STAGES + ('batch',) if stage in stages
+        ]
+
+    def write(self, file_path):
+        # *.prom files get the Prometheus text format (node_exporter textfile collector), anything else JSON
+        text = self.to_prometheus() if file_path.endswith('.prom') else self.to_json()
+        temp_path = file_path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(temp_path, file_path)
+
+
+@contextmanager
+def profiled(mode, report):
+    # mode is None, 'cprofile' or 'tracemalloc'; the text report is stored in report['text']
+    if mode is None:
+        yield
+        return
+
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            output = io.StringIO()
+            pstats.Stats(profiler, stream=output).sort_stats('cumulative').print_stats(30)
+            report['text'] = output.getvalue()
+        return
+
+    if mode == 'tracemalloc':
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start()
+        before = tracemalloc.take_snapshot()
+        try:
+            yield
+        finally:
+            after = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            if started_here:
+                tracemalloc.stop()
+            lines = [f"Current {current / 1024 / 1024:.1f} MiB, peak {peak / 1024 / 1024:.1f} MiB"]
+            lines.extend(str(stat) for stat in after.compare_to(before, 'lineno')[:20])
+            report['text'] = "\n".join(lines)
+        return
+
+    raise ValueError(f"Unknown profile mode: {mode}")
+
+
+class ExcelReportWriter:
+    MONEY_FORMAT = '#,##0.00" rub."'
+
     def __init__(self):
+        self.wb = Workbook(write_only=True)
+        self.style_arrays = {}
+        self.register_styles()
+
+    def register_styles(self):
+        border = Border(left=Side(style='thin'), right=Side(style='thin'),
+                        top=Side(style='thin'), bottom=Side(style='thin'))
+        center_align = Alignment(horizontal='center', vertical='center')
+        left_align = Alignment(horizontal='left', vertical='center')
+
+        def solid(color):
+            return PatternFill(start_color=color, end_color=color, fill_type="solid")
+
+        for style in (
+            NamedStyle(name='report_header', font=Font(bold=True, color="FFFFFF", size=12),
+                       fill=solid("2E75B6"), border=border, alignment=center_align),
+            NamedStyle(name='report_text', border=border, alignment=left_align),
+            NamedStyle(name='report_center', border=border, alignment=center_align),
+            NamedStyle(name='report_money', border=border, alignment=center_align,
+                       fill=solid("E2EFDA"), number_format=self.MONEY_FORMAT),
+            NamedStyle(name='report_manual', border=border, alignment=center_align, fill=solid("FFF2CC")),
+            NamedStyle(name='report_auto', border=border, alignment=center_align, fill=solid("E2F0D9")),
+        ):
+            self.wb.add_named_style(style)
+
+    def cell(self, ws, value, style):
+        if isinstance(value, float) and value != value:
+            value = None
+        if style == 'report_money' and value is None:
+            style = 'report_center'
+        cell = WriteOnlyCell(ws, value=value)
+        # Resolve each named style once and reuse its style array for every cell
+        style_array = self.style_arrays.get(style)
+        if style_array is None:
+            cell.style = style
+            self.style_arrays[style] = copy(cell._style)
+        else:
+            cell._style = copy(style_array)
+        return cell
+
+    def add_sheet(self, title, headers, widths):
+        ws = self.wb.create_sheet(title)
+        for column, width in enumerate(widths, 1):
+            ws.column_dimensions[get_column_letter(column)].width = width
+        ws.freeze_panes = 'A2'
+        ws.append([self.cell(ws, header, 'report_header') for header in headers])
+        return ws
+
+    def append_frame(self, ws, frame, columns, styles):
+        for row in frame[columns].itertuples(index=False, name=None):
+            ws.append([self.cell(ws, value, style(value) if callable(style) else style)
+                       for value, style in zip(row, styles)])
+
+    def save(self, file_path):
+        self.wb.save(file_path)
+
+
+def column_widths(frame, columns, headers, max_width):
+    widths = []
+    for column, header in zip(columns, headers):
+        longest = len(str(header))
+        if not frame.empty:
+            length = frame[column].astype(str).str.len().max()
+            if pd.notna(length):
+                longest = max(longest, int(length))
+        widths.append(min(longest + 2, max_width))
+    return widths
+
+
+class ParquetArchive:
+    # payments/month=YYYY-MM/part-<first id>-<last id>.parquet plus a clients snapshot. Each export
+    # appends the payments added since the watermark (the highest payment_id already archived)
+    STATE_FILE = "_watermark.json"
+    PAYMENT_COLUMNS = (
+        ('payment_id', 'int64'), ('client_id', 'int64'), ('fio', 'string'), ('amount', 'float64'),
+        ('payment_date', 'string'), ('bank_name', 'string'), ('is_manual', 'int64'),
+        ('file_hash', 'string'), ('created_date', 'string'),
+    )
+    CLIENT_COLUMNS = (
+        ('client_id', 'int64'), ('fio', 'string'), ('phone', 'string'), ('account', 'string'),
+        ('total_debt', 'float64'), ('created_date', 'string'), ('paid_total', 'float64'),
+        ('payment_count', 'int64'), ('remaining_debt', 'float64'),
+    )
+
+    def __init__(self, root):
+        if pq is None:
+            raise RuntimeError("Install pyarrow: pip install pyarrow")
+        self.root = root
+
+    def schema(self, columns):
+        types = {'int64': pa.int64(), 'float64': pa.float64(), 'string': pa.string()}
+        return pa.schema([(name, types[kind]) for name, kind in columns])
+
+    def load_state(self):
+        try:
+            with open(os.path.join(self.root, self.STATE_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {'payment_id': 0, 'rows': 0}
+
+    def save_state(self, state):
+        def write(path):
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, indent=2)
+
+        self.write_atomic(os.path.join(self.root, self.STATE_FILE), write)
+
+    def write_atomic(self, path, write):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        write(temp_path)
+        os.replace(temp_path, path)
+
+    def write_table(self, path, frame, columns):
+        table = pa.Table.from_pandas(frame[[name for name, _ in columns]], schema=self.schema(columns),
+                                     preserve_index=False)
+        self.write_atomic(path, lambda temp_path: pq.write_table(table, temp_path, compression='zstd'))
+
+    def append_payments(self, chunks):
+        state = self.load_state()
+        appended = 0
+        for frame in chunks:
+            if frame.empty:
+                continue
+            for month, group in frame.groupby('month', sort=True):
+                first, last = int(group['payment_id'].min()), int(group['payment_id'].max())
+                path = os.path.join(self.root, 'payments', f"month={month}", f"part-{first:010d}-{last:010d}.parquet")
+                self.write_table(path, group, self.PAYMENT_COLUMNS)
+            appended += len(frame)
+            # Parts are written before the watermark moves, so a crash only re-exports the last chunk
+            state['payment_id'] = int(frame['payment_id'].max())
+            state['rows'] = state.get('rows', 0) + len(frame)
+            state['exported_at'] = datetime.now().isoformat(timespec='seconds')
+            self.save_state(state)
+        return appended, state
+
+    def write_clients(self, frame):
+        self.write_table(os.path.join(self.root, 'clients', 'clients.parquet'), frame, self.CLIENT_COLUMNS)
+
+    def clear(self):
+        for name in ('payments', 'clients'):
+            shutil.rmtree(os.path.join(self.root, name), ignore_errors=True)
+        state_path = os.path.join(self.root, self.STATE_FILE)
+        if os.path.exists(state_path):
+            os.remove(state_path)
+
+    def read(self, table='payments', columns=None, months=None, as_arrow=False):
+        # Files are memory-mapped, and month filters skip whole partition directories
+        path = os.path.join(self.root, table)
+        filters = [('month', 'in', list(months))] if months and table == 'payments' else None
+        result = pq.read_table(path, columns=columns, filters=filters, memory_map=True,
+                               partitioning='hive' if table == 'payments' else None)
+        return result if as_arrow else result.to_pandas()
+
+
+class AccountingWorkOptimizer:
+    NEW_CLIENT_POLICIES = ('ask', 'default', 'pending', 'skip')
+
+    def __init__(self, db_file="receipts_database.db", extraction_workers=None, extraction_chunksize=4,
+                 headless=False, new_client_policy=None, default_debt=1000.0,
+                 extraction_cache_size=256 * 1024 * 1024, match_threshold=0.85,
+                 max_pdf_pages=10, lazy_extraction=True, ocr_workers=2, ocr_page_timeout=60,
+                 ocr_languages="rus+eng"):
         self.analyzer = ReceiptAnalyzer()
-        self.db_file = "receipts_database.db"
+        self.db_file = db_file
+        self.extractor = ParallelExtractor(extraction_workers, extraction_chunksize)
+        self.max_pdf_pages = max_pdf_pages
+        self.lazy_extraction = lazy_extraction
+        self.extraction_cache = None
+        if extraction_cache_size:
+            self.extraction_cache = ExtractionCache(
+                os.path.splitext(db_file)[0] + "_extraction_cache.db", extraction_cache_size)
+        self.debt_prompt = None
+        self.headless = headless or messagebox is None
+        if new_client_policy is None:
+            new_client_policy = 'pending' if self.headless else 'ask'
+        if new_client_policy not in self.NEW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown new client policy: {new_client_policy}")
+        self.new_client_policy = new_client_policy
+        self.default_debt = default_debt
+        self.match_threshold = match_threshold
+        self.client_index = None
+        self.metrics = PipelineMetrics()
+        self.last_profile = None
+        self.ocr = None
+        if ocr_workers and OcrEngine.available():
+            self.ocr = OcrEngine(ocr_workers, ocr_languages, ocr_page_timeout, metrics=self.metrics)
+        self.db = DatabaseConnectionManager(self.db_file)
         self.init_database()
+        self.fingerprinter = FileFingerprinter(
+            self.db,
+            self.get_setting('hash_algorithm', 'blake2b'),
+            self.get_setting('size_filter', '1') == '1'
+        )
+
+    def close(self):
+        if self.ocr is not None:
+            self.ocr.shutdown()
+        self.db.close_all()
+        if self.extraction_cache is not None:
+            self.extraction_cache.close()
+
+    def warn(self, title, message):
+        if self.headless:
+            print(f"{title}: {message}")
+        else:
+            messagebox.showwarning(title, message)
+
+    SCHEMA_MIGRATIONS = (
+        'migration_base_schema',
+        'migration_unique_file_hash',
+        'migration_client_lookup_index',
+        'migration_payment_client_date_index',
+        'migration_client_balances',
+        'migration_pending_receipts',
+        'migration_file_fingerprints',
+        'migration_browse_indexes',
+        'migration_payment_stats',
+        'migration_typed_payments',
+        'migration_receipt_fingerprints',
+        'migration_receipt_text_store',
+        'migration_legacy_fingerprints',
+    )
 
     def init_database(self):
-        conn = sqlite3.connect(self.db_file)
-        cursor = conn.cursor()
+        self.migrate_database()
+
+    def schema_version(self):
+        return self.db.connect().execute('PRAGMA user_version').fetchone()[0]
 
+    def migrate_database(self, target_version=None):
+        if target_version is None:
+            target_version = len(self.SCHEMA_MIGRATIONS)
+
+        version = self.schema_version()
+        while version < target_version:
+            migration = getattr(self, self.SCHEMA_MIGRATIONS[version])
+            with self.db.transaction() as conn:
+                migration(conn.cursor())
+                conn.execute(f'PRAGMA user_version = {version + 1}')
+            version += 1
+        return version
+
+    def table_columns(self, cursor, table):
+        cursor.execute(f'PRAGMA table_info({table})')
+        return {row[1] for row in cursor.fetchall()}
+
+    def migration_base_schema(self, cursor):
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS clients (
                 client_id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -163,28 +1311,679 @@ class AccountingWorkOptimizer:
             )
         ''')
 
-        try:
+        # Databases created by early versions lack these columns
+        columns = self.table_columns(cursor, 'payments')
+        if 'file_hash' not in columns:
             cursor.execute("ALTER TABLE payments ADD COLUMN file_hash TEXT")
-        except sqlite3.OperationalError:
-            pass
+        if 'is_manual' not in columns:
+            cursor.execute("ALTER TABLE payments ADD COLUMN is_manual INTEGER DEFAULT 0")
 
+    def migration_unique_file_hash(self, cursor):
+        # Manual payments used to store '' as their hash; NULLs don't collide in a unique index
+        cursor.execute("UPDATE payments SET file_hash = NULL WHERE file_hash = ''")
         try:
-            cursor.execute("ALTER TABLE payments ADD COLUMN is_manual INTEGER DEFAULT 0")
-        except sqlite3.OperationalError:
-            pass
+            cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_payments_file_hash ON payments (file_hash)')
+        except sqlite3.IntegrityError as e:
+            print(f"Duplicate file hashes found, creating non-unique index: {e}")
+            cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_file_hash ON payments (file_hash)')
+
+    def migration_client_lookup_index(self, cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_clients_fio_phone_account ON clients (fio, phone, account)')
+
+    def migration_payment_client_date_index(self, cursor):
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_client_date ON payments (client_id, payment_date)')
+
+    def migration_client_balances(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS client_balances (
+                client_id INTEGER PRIMARY KEY,
+                paid_total REAL NOT NULL DEFAULT 0,
+                payment_count INTEGER NOT NULL DEFAULT 0,
+                last_payment_date TEXT,
+                remaining_debt REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        self.legacy_create_balance_triggers(cursor)
+        self.legacy_rebuild_client_balances(cursor)
+
+    def migration_pending_receipts(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pending_receipts (
+                pending_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                file_hash TEXT UNIQUE,
+                filename TEXT,
+                fio TEXT NOT NULL,
+                phone TEXT,
+                account TEXT,
+                amount REAL NOT NULL,
+                payment_date TEXT NOT NULL,
+                bank_name TEXT,
+                receipt_text TEXT,
+                created_date TEXT
+            )
+        ''')
+        # A queued receipt that gets booked by a later ingest leaves the queue
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_clear_pending AFTER INSERT ON payments
+            WHEN NEW.file_hash IS NOT NULL
+            BEGIN
+                DELETE FROM pending_receipts WHERE file_hash = NEW.file_hash;
+            END
+        ''')
+
+    def migration_file_fingerprints(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS settings (
+                key TEXT PRIMARY KEY,
+                value TEXT
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS file_fingerprints (
+                path TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                algorithm TEXT NOT NULL,
+                file_hash TEXT NOT NULL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_file_fingerprints_size ON file_fingerprints (size)')
+
+        # Existing MD5 hashes must keep matching, and their file sizes were never recorded
+        cursor.execute('''
+            SELECT EXISTS (SELECT 1 FROM payments WHERE file_hash IS NOT NULL)
+                OR EXISTS (SELECT 1 FROM pending_receipts WHERE file_hash IS NOT NULL)
+        ''')
+        legacy = cursor.fetchone()[0]
+        cursor.executemany('INSERT OR IGNORE INTO settings (key, value) VALUES (?, ?)', [
+            ('hash_algorithm', 'md5' if legacy else 'blake2b'),
+            ('size_filter', '0' if legacy else '1'),
+        ])
+
+    def migration_browse_indexes(self, cursor):
+        # Keyset pages over (sort key, id) read straight from these instead of sorting the table
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_payments_date_key
+            ON payments ({self.legacy_date_key_sql('payment_date')}, payment_id)
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_payments_amount ON payments (amount, payment_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_clients_debt ON clients (total_debt, client_id)')
 
-        conn.commit()
-        conn.close()
+    def migration_typed_payments(self, cursor):
+        # DD.MM.YYYY text and REAL rubles become ISO dates and integer kopecks; `amount` stays
+        # readable as a generated column so queries and reports that select it keep working
+        for trigger in ('trg_clients_insert_balance', 'trg_clients_update_balance', 'trg_clients_delete_balance'):
+            cursor.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        cursor.execute('DROP TABLE IF EXISTS client_balances')
+        cursor.execute('DROP TABLE IF EXISTS payment_stats')
+
+        cursor.execute('''
+            CREATE TABLE payments_typed (
+                payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+                client_id INTEGER,
+                amount_kopecks INTEGER NOT NULL,
+                amount REAL GENERATED ALWAYS AS (amount_kopecks / 100.0) VIRTUAL,
+                payment_date TEXT NOT NULL CHECK (payment_date GLOB '[0-9][0-9][0-9][0-9]-[0-9][0-9]-[0-9][0-9]'),
+                receipt_text TEXT,
+                bank_name TEXT,
+                created_date TEXT,
+                file_hash TEXT,
+                is_manual INTEGER DEFAULT 0,
+                FOREIGN KEY (client_id) REFERENCES clients (client_id)
+            )
+        ''')
+        # Unparseable legacy dates fall back to the day the payment was recorded
+        cursor.execute('''
+            INSERT INTO payments_typed (payment_id, client_id, amount_kopecks, payment_date, receipt_text,
+                                        bank_name, created_date, file_hash, is_manual)
+            SELECT payment_id, client_id, kopecks(amount),
+                   COALESCE(iso_date(payment_date), iso_date(created_date), date('now')),
+                   receipt_text, bank_name, created_date, file_hash, is_manual
+            FROM payments
+            ORDER BY payment_id
+        ''')
+        cursor.execute('DROP TABLE payments')
+        cursor.execute('ALTER TABLE payments_typed RENAME TO payments')
+
+        self.migration_unique_file_hash(cursor)
+        self.migration_payment_client_date_index(cursor)
+        cursor.execute('CREATE INDEX idx_payments_date ON payments (payment_date, payment_id, amount_kopecks)')
+        cursor.execute('CREATE INDEX idx_payments_amount ON payments (amount_kopecks, payment_id)')
+        cursor.execute('''
+            CREATE TRIGGER trg_payments_clear_pending AFTER INSERT ON payments
+            WHEN NEW.file_hash IS NOT NULL
+            BEGIN
+                DELETE FROM pending_receipts WHERE file_hash = NEW.file_hash;
+            END
+        ''')
+        cursor.execute("UPDATE pending_receipts SET payment_date = COALESCE(iso_date(payment_date), payment_date)")
+
+        cursor.execute('''
+            CREATE TABLE client_balances (
+                client_id INTEGER PRIMARY KEY,
+                paid_kopecks INTEGER NOT NULL DEFAULT 0,
+                paid_total REAL GENERATED ALWAYS AS (paid_kopecks / 100.0) VIRTUAL,
+                payment_count INTEGER NOT NULL DEFAULT 0,
+                last_payment_date TEXT,
+                remaining_debt REAL NOT NULL DEFAULT 0
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE payment_stats (
+                bank_name TEXT NOT NULL,
+                month TEXT NOT NULL,
+                payment_count INTEGER NOT NULL DEFAULT 0,
+                amount_kopecks INTEGER NOT NULL DEFAULT 0,
+                amount_total REAL GENERATED ALWAYS AS (amount_kopecks / 100.0) VIRTUAL,
+                PRIMARY KEY (bank_name, month)
+            )
+        ''')
+        self.create_balance_triggers(cursor)
+        self.rebuild_client_balances(cursor)
+        self.create_stats_triggers(cursor)
+        self.rebuild_statistics(cursor)
+
+    def migration_payment_stats(self, cursor):
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS payment_stats (
+                bank_name TEXT NOT NULL,
+                month TEXT NOT NULL,
+                payment_count INTEGER NOT NULL DEFAULT 0,
+                amount_total REAL NOT NULL DEFAULT 0,
+                PRIMARY KEY (bank_name, month)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stat_counters (
+                name TEXT PRIMARY KEY,
+                value INTEGER NOT NULL DEFAULT 0
+            )
+        ''')
+        self.legacy_create_stats_triggers(cursor)
+        self.legacy_rebuild_statistics(cursor)
+
+    def get_setting(self, key, default=None):
+        row = self.db.connect().execute('SELECT value FROM settings WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else default
+
+    def migration_receipt_fingerprints(self, cursor):
+        cursor.execute('ALTER TABLE payments ADD COLUMN receipt_fingerprint TEXT')
+        cursor.execute('ALTER TABLE pending_receipts ADD COLUMN receipt_fingerprint TEXT')
+
+        # Earlier receipts are fingerprinted from their stored text; existing double bookings share one,
+        # so the indexes can't be unique
+        updates = cursor.connection.cursor()
+        for table, id_column in (('payments', 'payment_id'), ('pending_receipts', 'pending_id')):
+            manual_filter = 'AND is_manual = 0' if table == 'payments' else ''
+            rows = cursor.execute(f'SELECT {id_column}, receipt_text FROM {table} '
+                                  f'WHERE receipt_text IS NOT NULL {manual_filter}')
+            while True:
+                chunk = rows.fetchmany(10000)
+                if not chunk:
+                    break
+                updates.executemany(
+                    f'UPDATE {table} SET receipt_fingerprint = ? WHERE {id_column} = ?',
+                    [(receipt_fingerprint(self.analyzer.extract_entities(text)), row_id) for row_id, text in chunk]
+                )
+            cursor.execute(f'CREATE INDEX idx_{table}_fingerprint ON {table} (receipt_fingerprint) '
+                           f'WHERE receipt_fingerprint IS NOT NULL')
+
+    def migration_receipt_text_store(self, cursor):
+        # Receipt text moves out of the payments rows that every list and aggregate scans;
+        # it is zlib-compressed and only read when a payment is opened
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS receipt_texts (
+                payment_id INTEGER PRIMARY KEY,
+                body BLOB NOT NULL
+            )
+        ''')
+        inserts = cursor.connection.cursor()
+        rows = cursor.execute("SELECT payment_id, receipt_text FROM payments WHERE COALESCE(receipt_text, '') != ''")
+        while True:
+            chunk = rows.fetchmany(10000)
+            if not chunk:
+                break
+            inserts.executemany(self.RECEIPT_TEXT_INSERT_SQL,
+                                [(payment_id, compress_text(text)) for payment_id, text in chunk])
+        cursor.execute('ALTER TABLE payments DROP COLUMN receipt_text')
+        cursor.execute('''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_delete_text AFTER DELETE ON payments
+            BEGIN
+                DELETE FROM receipt_texts WHERE payment_id = OLD.payment_id;
+            END
+        ''')
+
+    def migration_legacy_fingerprints(self, cursor):
+        # Texts stored cut at LEGACY_TEXT_LIMIT may have lost the account and operation number that a full
+        # re-export carries, so those receipts are keyed on name, amount and date instead
+        updates = cursor.connection.cursor()
+        for table, select in (
+                ('payments', 'SELECT r.payment_id, inflate(r.body) FROM receipt_texts r '
+                             'JOIN payments p ON p.payment_id = r.payment_id WHERE p.is_manual = 0'),
+                ('pending_receipts', f'SELECT pending_id, receipt_text FROM pending_receipts '
+                                     f'WHERE length(receipt_text) >= {LEGACY_TEXT_LIMIT}')):
+            id_column = 'payment_id' if table == 'payments' else 'pending_id'
+            rows = cursor.execute(select)
+            while True:
+                chunk = rows.fetchmany(10000)
+                if not chunk:
+                    break
+                updates.executemany(
+                    f'UPDATE {table} SET receipt_fingerprint = ? WHERE {id_column} = ?',
+                    [(receipt_fingerprint(self.analyzer.extract_entities(text), legacy=True), row_id)
+                     for row_id, text in chunk if len(text) >= LEGACY_TEXT_LIMIT]
+                )
+
+    # Schema versions 5-9 as they were written, for DD.MM.YYYY dates and REAL amounts; migrations keep
+    # calling these so each version means the same thing, and migration_typed_payments replaces them all
+    def legacy_date_key_sql(self, column):
+        # payment_date is DD.MM.YYYY text; compare as YYYYMMDD
+        return f"(substr({column}, 7, 4) || substr({column}, 4, 2) || substr({column}, 1, 2))"
+
+    def legacy_month_key_sql(self, column):
+        return f"(substr({column}, 7, 4) || '-' || substr({column}, 4, 2))"
+
+    def legacy_last_payment_date_sql(self, client_column):
+        return (f"(SELECT payment_date FROM payments WHERE client_id = {client_column} "
+                f"ORDER BY {self.legacy_date_key_sql('payment_date')} DESC LIMIT 1)")
+
+    def legacy_create_balance_triggers(self, cursor):
+        add_payment_sql = f'''
+            INSERT OR IGNORE INTO client_balances (client_id, paid_total, payment_count, remaining_debt)
+                SELECT client_id, 0, 0, total_debt FROM clients WHERE client_id = NEW.client_id;
+            UPDATE client_balances SET
+                paid_total = paid_total + NEW.amount,
+                payment_count = payment_count + 1,
+                remaining_debt = remaining_debt - NEW.amount,
+                last_payment_date = CASE
+                    WHEN last_payment_date IS NULL
+                         OR {self.legacy_date_key_sql('NEW.payment_date')} > {self.legacy_date_key_sql('last_payment_date')}
+                    THEN NEW.payment_date ELSE last_payment_date END
+            WHERE client_id = NEW.client_id;
+        '''
+        remove_payment_sql = f'''
+            UPDATE client_balances SET
+                paid_total = paid_total - OLD.amount,
+                payment_count = payment_count - 1,
+                remaining_debt = remaining_debt + OLD.amount,
+                last_payment_date = {self.legacy_last_payment_date_sql('OLD.client_id')}
+            WHERE client_id = OLD.client_id;
+        '''
+
+        triggers = [
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_insert_balance AFTER INSERT ON clients
+            BEGIN
+                INSERT OR IGNORE INTO client_balances (client_id, paid_total, payment_count, remaining_debt)
+                VALUES (NEW.client_id, 0, 0, NEW.total_debt);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_update_balance AFTER UPDATE OF total_debt ON clients
+            BEGIN
+                UPDATE client_balances SET remaining_debt = NEW.total_debt - paid_total
+                WHERE client_id = NEW.client_id;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_delete_balance AFTER DELETE ON clients
+            BEGIN
+                DELETE FROM client_balances WHERE client_id = OLD.client_id;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_insert_balance AFTER INSERT ON payments
+            WHEN NEW.client_id IS NOT NULL
+            BEGIN
+                {add_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_delete_balance AFTER DELETE ON payments
+            WHEN OLD.client_id IS NOT NULL
+            BEGIN
+                {remove_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_update_balance
+            AFTER UPDATE OF client_id, amount, payment_date ON payments
+            BEGIN
+                {remove_payment_sql}
+                {add_payment_sql}
+            END
+            ''',
+        ]
+        # executescript() would commit the surrounding migration transaction
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+    def legacy_rebuild_client_balances(self, cursor):
+        cursor.execute('DELETE FROM client_balances')
+        cursor.execute(f'''
+            INSERT INTO client_balances (client_id, paid_total, payment_count, last_payment_date, remaining_debt)
+            SELECT c.client_id,
+                   COALESCE(p.paid, 0),
+                   COALESCE(p.payment_count, 0),
+                   {self.legacy_last_payment_date_sql('c.client_id')},
+                   c.total_debt - COALESCE(p.paid, 0)
+            FROM clients c
+            LEFT JOIN (
+                SELECT client_id, SUM(amount) AS paid, COUNT(*) AS payment_count
+                FROM payments
+                GROUP BY client_id
+            ) p ON p.client_id = c.client_id
+        ''')
+        return cursor.rowcount
+
+    def legacy_create_stats_triggers(self, cursor):
+        add_payment_sql = f'''
+            INSERT OR IGNORE INTO payment_stats (bank_name, month, payment_count, amount_total)
+            VALUES (COALESCE(NEW.bank_name, ''), {self.legacy_month_key_sql('NEW.payment_date')}, 0, 0);
+            UPDATE payment_stats SET
+                payment_count = payment_count + 1,
+                amount_total = amount_total + NEW.amount
+            WHERE bank_name = COALESCE(NEW.bank_name, '') AND month = {self.legacy_month_key_sql('NEW.payment_date')};
+        '''
+        remove_payment_sql = f'''
+            UPDATE payment_stats SET
+                payment_count = payment_count - 1,
+                amount_total = amount_total - OLD.amount
+            WHERE bank_name = COALESCE(OLD.bank_name, '') AND month = {self.legacy_month_key_sql('OLD.payment_date')};
+            DELETE FROM payment_stats
+            WHERE bank_name = COALESCE(OLD.bank_name, '') AND month = {self.legacy_month_key_sql('OLD.payment_date')}
+                  AND payment_count <= 0;
+        '''
+
+        triggers = [
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_insert_stats AFTER INSERT ON clients
+            BEGIN
+                INSERT OR IGNORE INTO stat_counters (name, value) VALUES ('clients', 0);
+                UPDATE stat_counters SET value = value + 1 WHERE name = 'clients';
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_delete_stats AFTER DELETE ON clients
+            BEGIN
+                UPDATE stat_counters SET value = value - 1 WHERE name = 'clients';
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_insert_stats AFTER INSERT ON payments
+            BEGIN
+                {add_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_delete_stats AFTER DELETE ON payments
+            BEGIN
+                {remove_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_update_stats
+            AFTER UPDATE OF amount, payment_date, bank_name ON payments
+            BEGIN
+                {remove_payment_sql}
+                {add_payment_sql}
+            END
+            ''',
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+    def legacy_rebuild_statistics(self, cursor):
+        cursor.execute('DELETE FROM payment_stats')
+        cursor.execute(f'''
+            INSERT INTO payment_stats (bank_name, month, payment_count, amount_total)
+            SELECT COALESCE(bank_name, ''), {self.legacy_month_key_sql('payment_date')}, COUNT(*), SUM(amount)
+            FROM payments
+            GROUP BY 1, 2
+        ''')
+        groups = cursor.rowcount
+        cursor.execute('''
+            INSERT OR REPLACE INTO stat_counters (name, value)
+            SELECT 'clients', COUNT(*) FROM clients
+        ''')
+        return groups
+
+    def date_key_sql(self, column):
+        # payment_date is ISO text, which already sorts by date and can use the column's indexes
+        return column
+
+    def month_key_sql(self, column):
+        return f"substr({column}, 1, 7)"
+
+    def last_payment_date_sql(self, client_column):
+        return f"(SELECT MAX(payment_date) FROM payments WHERE client_id = {client_column})"
+
+    def create_balance_triggers(self, cursor):
+        # remaining_debt is recomputed from the kopeck total so repeated updates don't accumulate float error
+        add_payment_sql = '''
+            INSERT OR IGNORE INTO client_balances (client_id, paid_kopecks, payment_count, remaining_debt)
+                SELECT client_id, 0, 0, total_debt FROM clients WHERE client_id = NEW.client_id;
+            UPDATE client_balances SET
+                paid_kopecks = paid_kopecks + NEW.amount_kopecks,
+                payment_count = payment_count + 1,
+                remaining_debt = (SELECT total_debt FROM clients WHERE client_id = NEW.client_id)
+                                 - (paid_kopecks + NEW.amount_kopecks) / 100.0,
+                last_payment_date = CASE
+                    WHEN last_payment_date IS NULL OR NEW.payment_date > last_payment_date
+                    THEN NEW.payment_date ELSE last_payment_date END
+            WHERE client_id = NEW.client_id;
+        '''
+        remove_payment_sql = f'''
+            UPDATE client_balances SET
+                paid_kopecks = paid_kopecks - OLD.amount_kopecks,
+                payment_count = payment_count - 1,
+                remaining_debt = (SELECT total_debt FROM clients WHERE client_id = OLD.client_id)
+                                 - (paid_kopecks - OLD.amount_kopecks) / 100.0,
+                last_payment_date = {self.last_payment_date_sql('OLD.client_id')}
+            WHERE client_id = OLD.client_id;
+        '''
+
+        triggers = [
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_insert_balance AFTER INSERT ON clients
+            BEGIN
+                INSERT OR IGNORE INTO client_balances (client_id, paid_kopecks, payment_count, remaining_debt)
+                VALUES (NEW.client_id, 0, 0, NEW.total_debt);
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_update_balance AFTER UPDATE OF total_debt ON clients
+            BEGIN
+                UPDATE client_balances SET remaining_debt = NEW.total_debt - paid_kopecks / 100.0
+                WHERE client_id = NEW.client_id;
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_delete_balance AFTER DELETE ON clients
+            BEGIN
+                DELETE FROM client_balances WHERE client_id = OLD.client_id;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_insert_balance AFTER INSERT ON payments
+            WHEN NEW.client_id IS NOT NULL
+            BEGIN
+                {add_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_delete_balance AFTER DELETE ON payments
+            WHEN OLD.client_id IS NOT NULL
+            BEGIN
+                {remove_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_update_balance
+            AFTER UPDATE OF client_id, amount_kopecks, payment_date ON payments
+            BEGIN
+                {remove_payment_sql}
+                {add_payment_sql}
+            END
+            ''',
+        ]
+        # executescript() would commit the surrounding migration transaction
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+    def rebuild_client_balances(self, cursor=None):
+        if cursor is None:
+            with self.db.transaction() as conn:
+                return self.rebuild_client_balances(conn.cursor())
+
+        cursor.execute('DELETE FROM client_balances')
+        cursor.execute(f'''
+            INSERT INTO client_balances (client_id, paid_kopecks, payment_count, last_payment_date, remaining_debt)
+            SELECT c.client_id,
+                   COALESCE(p.paid, 0),
+                   COALESCE(p.payment_count, 0),
+                   p.last_payment_date,
+                   c.total_debt - COALESCE(p.paid, 0) / 100.0
+            FROM clients c
+            LEFT JOIN (
+                SELECT client_id, SUM(amount_kopecks) AS paid, COUNT(*) AS payment_count,
+                       MAX(payment_date) AS last_payment_date
+                FROM payments
+                GROUP BY client_id
+            ) p ON p.client_id = c.client_id
+        ''')
+        return cursor.rowcount
+
+    def create_stats_triggers(self, cursor):
+        add_payment_sql = f'''
+            INSERT OR IGNORE INTO payment_stats (bank_name, month, payment_count, amount_kopecks)
+            VALUES (COALESCE(NEW.bank_name, ''), {self.month_key_sql('NEW.payment_date')}, 0, 0);
+            UPDATE payment_stats SET
+                payment_count = payment_count + 1,
+                amount_kopecks = amount_kopecks + NEW.amount_kopecks
+            WHERE bank_name = COALESCE(NEW.bank_name, '') AND month = {self.month_key_sql('NEW.payment_date')};
+        '''
+        remove_payment_sql = f'''
+            UPDATE payment_stats SET
+                payment_count = payment_count - 1,
+                amount_kopecks = amount_kopecks - OLD.amount_kopecks
+            WHERE bank_name = COALESCE(OLD.bank_name, '') AND month = {self.month_key_sql('OLD.payment_date')};
+            DELETE FROM payment_stats
+            WHERE bank_name = COALESCE(OLD.bank_name, '') AND month = {self.month_key_sql('OLD.payment_date')}
+                  AND payment_count <= 0;
+        '''
+
+        triggers = [
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_insert_stats AFTER INSERT ON clients
+            BEGIN
+                INSERT OR IGNORE INTO stat_counters (name, value) VALUES ('clients', 0);
+                UPDATE stat_counters SET value = value + 1 WHERE name = 'clients';
+            END
+            ''',
+            '''
+            CREATE TRIGGER IF NOT EXISTS trg_clients_delete_stats AFTER DELETE ON clients
+            BEGIN
+                UPDATE stat_counters SET value = value - 1 WHERE name = 'clients';
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_insert_stats AFTER INSERT ON payments
+            BEGIN
+                {add_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_delete_stats AFTER DELETE ON payments
+            BEGIN
+                {remove_payment_sql}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS trg_payments_update_stats
+            AFTER UPDATE OF amount_kopecks, payment_date, bank_name ON payments
+            BEGIN
+                {remove_payment_sql}
+                {add_payment_sql}
+            END
+            ''',
+        ]
+        for trigger in triggers:
+            cursor.execute(trigger)
+
+    def rebuild_statistics(self, cursor=None):
+        if cursor is None:
+            with self.db.transaction() as conn:
+                return self.rebuild_statistics(conn.cursor())
+
+        cursor.execute('DELETE FROM payment_stats')
+        cursor.execute(f'''
+            INSERT INTO payment_stats (bank_name, month, payment_count, amount_kopecks)
+            SELECT COALESCE(bank_name, ''), {self.month_key_sql('payment_date')}, COUNT(*), SUM(amount_kopecks)
+            FROM payments
+            GROUP BY 1, 2
+        ''')
+        groups = cursor.rowcount
+        cursor.execute('''
+            INSERT OR REPLACE INTO stat_counters (name, value)
+            SELECT 'clients', COUNT(*) FROM clients
+        ''')
+        return groups
+
+    def verify_client_balances(self, tolerance=0.005):
+        cursor = self.db.connect().cursor()
+        cursor.execute(f'''
+            SELECT c.client_id,
+                   b.paid_total, COALESCE(p.paid, 0),
+                   b.payment_count, COALESCE(p.payment_count, 0),
+                   b.last_payment_date, p.last_payment_date,
+                   b.remaining_debt, c.total_debt - COALESCE(p.paid, 0)
+            FROM clients c
+            LEFT JOIN client_balances b ON b.client_id = c.client_id
+            LEFT JOIN (
+                SELECT client_id, SUM(amount_kopecks) / 100.0 AS paid, COUNT(*) AS payment_count,
+                       MAX(payment_date) AS last_payment_date
+                FROM payments
+                GROUP BY client_id
+            ) p ON p.client_id = c.client_id
+        ''')
+
+        mismatches = []
+        for (client_id, stored_paid, paid, stored_count, count,
+             stored_last, last, stored_remaining, remaining) in cursor.fetchall():
+            if (stored_paid is None or abs(stored_paid - paid) > tolerance
+                    or stored_count != count or stored_last != last
+                    or abs(stored_remaining - remaining) > tolerance):
+                mismatches.append({
+                    'client_id': client_id,
+                    'stored': (stored_paid, stored_count, stored_last, stored_remaining),
+                    'actual': (paid, count, last, remaining),
+                })
+        return mismatches
 
     def calculate_file_hash(self, file_path):
+        return self.fingerprinter.fingerprint(file_path)
+
+    def find_duplicate_receipt(self, *fingerprints):
+        # The booked or queued receipt for the same transfer, as "payment #12" / "pending #3";
+        # pass the receipt's full and legacy fingerprints
+        fingerprints = [fingerprint for fingerprint in fingerprints if fingerprint]
+        if not fingerprints:
+            return None
+
+        placeholders = ', '.join('?' * len(fingerprints))
         try:
-            hasher = hashlib.md5()
-            with open(file_path, 'rb') as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hasher.update(chunk)
-            return hasher.hexdigest()
+            cursor = self.db.connect().cursor()
+            cursor.execute(f'''
+                SELECT 'payment #' || payment_id FROM payments WHERE receipt_fingerprint IN ({placeholders})
+                UNION ALL
+                SELECT 'pending #' || pending_id FROM pending_receipts WHERE receipt_fingerprint IN ({placeholders})
+                LIMIT 1
+            ''', fingerprints * 2)
+            result = cursor.fetchone()
+            return result[0] if result else None
         except Exception as e:
-            print(f"Hash calculation error: {e}")
+            print(f"Duplicate check error: {e}")
             return None
 
     def is_duplicate_file(self, file_hash):
@@ -192,89 +1991,231 @@ class AccountingWorkOptimizer:
             return False
 
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+            cursor = self.db.connect().cursor()
             cursor.execute('SELECT payment_id FROM payments WHERE file_hash = ?', (file_hash,))
             result = cursor.fetchone()
-            conn.close()
             return result is not None
         except Exception as e:
             print(f"Duplicate check error: {e}")
             return False
 
     def extract_text_from_pdf(self, pdf_path):
-        text = ""
         try:
-            import PyPDF2
-            with open(pdf_path, 'rb') as file:
-                reader = PyPDF2.PdfReader(file)
-                for page in reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text
+            return read_pdf_text(pdf_path, self.max_pdf_pages, self.lazy_extraction)
         except ImportError:
-            messagebox.showwarning("Warning", "Install PyPDF2: pip install PyPDF2")
-            return ""
-        except Exception as e:
-            print(f"Text extraction error: {e}")
+            self.warn("Warning", "Install PyPDF2: pip install PyPDF2")
             return ""
 
-    def find_or_create_client(self, fio, phone="", account=""):
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            query = "SELECT client_id, total_debt FROM clients WHERE fio = ?"
-            params = [fio]
+    def extraction_settings(self):
+        return f"pages={self.max_pdf_pages};lazy={int(bool(self.lazy_extraction))}"
 
-            if phone:
-                query += " AND phone = ?"
-                params.append(phone)
-            if account:
-                query += " AND account = ?"
-                params.append(account)
+    def iter_extracted(self, pdf_files):
+        pdf_files = list(pdf_files)
+        try:
+            import PyPDF2
+            can_extract = True
+        except ImportError:
+            self.warn("Warning", "Install PyPDF2: pip install PyPDF2")
+            can_extract = False
+
+        fingerprinter = self.fingerprinter
+        metrics = self.metrics
+        signatures = [fingerprinter.stat(pdf_file) for pdf_file in pdf_files]
+        hashes = [None] * len(pdf_files)
+        to_hash = []
+        fresh = set()
+        for index, signature in enumerate(signatures):
+            if signature is None:
+                continue
+            hashes[index] = fingerprinter.lookup(signature)
+            if hashes[index] is None:
+                if can_extract and not fingerprinter.may_be_known(signature[1]):
+                    fresh.add(index)
+                else:
+                    to_hash.append(index)
+
+        metrics.increment('fingerprint_memo_hits', sum(1 for file_hash in hashes if file_hash))
+        if to_hash:
+            with metrics.time('hash', items=len(to_hash)):
+                computed = list(self.extractor.map(fingerprinter.hash_function, [pdf_files[i] for i in to_hash]))
+            for index, file_hash in zip(to_hash, computed):
+                hashes[index] = file_hash
+            fingerprinter.remember((signatures[index], hashes[index]) for index in to_hash)
+
+        # Duplicates and cached files are settled from the hash alone; only the rest reach PyPDF2.
+        # Files of a never-seen size are hashed by the extraction worker in the same read.
+        plan = []
+        jobs = []
+        batch_hashes = set()
+        for index, (pdf_file, file_hash) in enumerate(zip(pdf_files, hashes)):
+            if index in fresh:
+                plan.append((index, None, None, True))
+                jobs.append((pdf_file, fingerprinter.algorithm, self.max_pdf_pages, self.lazy_extraction))
+                continue
+            if not file_hash:
+                plan.append((index, None, "", False))
+                continue
+            if file_hash in batch_hashes or self.is_duplicate_file(file_hash):
+                plan.append((index, file_hash, None, False))
+                continue
+            batch_hashes.add(file_hash)
+
+            text = (self.extraction_cache.get_text(file_hash, self.extraction_settings())
+                    if self.extraction_cache is not None else None)
+            if text is not None:
+                metrics.increment('extraction_cache_hits')
+            if text is None and not can_extract:
+                text = ""
+            plan.append((index, file_hash, text, text is None))
+            if text is None:
+                jobs.append((pdf_file, None, self.max_pdf_pages, self.lazy_extraction))
+
+        # Files without a text layer go to the OCR pool and are yielded as their OCR finishes,
+        # after every text-layer file, so slow scans never hold up the rest of the batch
+        ocr_jobs = {}
+        extracted = self.extractor.map(extraction_job, jobs)
+        try:
+            with closing(extracted):
+                for index, file_hash, text, needs_extraction in plan:
+                    pdf_file = pdf_files[index]
+                    if needs_extraction:
+                        # Time spent waiting on the pool; with workers ahead this is less than the CPU time
+                        with metrics.time('extract'):
+                            worker_hash, text = next(extracted)
+                        if index in fresh:
+                            file_hash = worker_hash
+                            if not file_hash:
+                                yield index, pdf_file, None, ""
+                                continue
+                            fingerprinter.remember([(signatures[index], file_hash)])
+                            if file_hash in batch_hashes or self.is_duplicate_file(file_hash):
+                                yield index, pdf_file, file_hash, None
+                                continue
+                            batch_hashes.add(file_hash)
+                    if file_hash and text is not None and not text.strip() and self.ocr is not None:
+                        ocr_jobs[self.ocr.submit(pdf_file)] = (index, pdf_file, file_hash)
+                        continue
+                    if needs_extraction and self.extraction_cache is not None:
+                        self.extraction_cache.put_text(file_hash, text, self.extraction_settings())
+                    yield index, pdf_file, file_hash, text
+
+            for future in as_completed(ocr_jobs):
+                index, pdf_file, file_hash = ocr_jobs[future]
+                try:
+                    text = future.result()
+                except Exception as e:
+                    print(f"OCR error: {e}")
+                    text = ""
+                if self.extraction_cache is not None:
+                    self.extraction_cache.put_text(file_hash, text, self.extraction_settings())
+                yield index, pdf_file, file_hash, text
+        finally:
+            for future in ocr_jobs:
+                future.cancel()
+
+    def load_client_index(self):
+        if self.client_index is None:
+            rows = self.db.connect().execute(
+                'SELECT client_id, fio, phone, account, total_debt FROM clients').fetchall()
+            self.client_index = ClientIndex(self.match_threshold).load(rows)
+        return self.client_index
+
+    def invalidate_client_index(self):
+        self.client_index = None
+
+    def index_client(self, client_id, fio, phone, account, total_debt):
+        if self.client_index is not None:
+            self.client_index.add(client_id, fio, phone, account, total_debt)
+
+    def find_client(self, fio, phone="", account=""):
+        with self.metrics.time('resolve'):
+            return self.load_client_index().resolve(fio, phone, account)
+
+    def insert_client(self, conn, fio, phone, account, total_debt):
+        cursor = conn.cursor()
+        cursor.execute('''
+            INSERT INTO clients (fio, phone, account, total_debt, created_date)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (fio, phone or "", account or "", total_debt, datetime.now().strftime('%d.%m.%Y')))
+        return cursor.lastrowid
 
-            cursor.execute(query, params)
-            result = cursor.fetchone()
+    def find_or_create_client(self, fio, phone="", account=""):
+        try:
+            result = self.find_client(fio, phone, account)
 
             if result:
                 client_id, total_debt = result
-                conn.close()
                 return client_id, total_debt
             else:
                 total_debt = self.ask_for_debt_info(fio)
                 if total_debt is None:
-                    conn.close()
                     return None, None
 
-                cursor.execute('''
-                    INSERT INTO clients (fio, phone, account, total_debt, created_date)
-                    VALUES (?, ?, ?, ?, ?)
-                ''', (fio, phone or "", account or "", total_debt, datetime.now().strftime('%d.%m.%Y')))
-
-                client_id = cursor.lastrowid
-                conn.commit()
-                conn.close()
+                with self.db.transaction() as conn:
+                    client_id = self.insert_client(conn, fio, phone, account, total_debt)
+                self.index_client(client_id, fio, phone, account, total_debt)
                 return client_id, total_debt
 
         except Exception as e:
             print(f"Client search/creation error: {e}")
             return None, None
 
-    def add_payment(self, client_id, amount, payment_date, receipt_text, bank_name, file_hash, is_manual=False):
-        try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+    PAYMENT_INSERT_SQL = '''
+        INSERT INTO payments (client_id, amount_kopecks, payment_date, bank_name, created_date,
+                              file_hash, is_manual, receipt_fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+    RECEIPT_TEXT_INSERT_SQL = 'INSERT OR REPLACE INTO receipt_texts (payment_id, body) VALUES (?, ?)'
+
+    def payment_row(self, client_id, amount, payment_date, bank_name, file_hash, is_manual=False, fingerprint=None):
+        # Takes rubles and DD.MM.YYYY (or ISO) dates as the parser and dialogs produce them
+        return (client_id, to_kopecks(amount), iso_date(payment_date) or date.today().isoformat(),
+                bank_name, datetime.now().strftime('%d.%m.%Y'), file_hash, 1 if is_manual else 0, fingerprint)
+
+    def insert_payment(self, conn, row, receipt_text=None):
+        # The text goes to receipt_texts under the new payment_id
+        payment_id = conn.execute(self.PAYMENT_INSERT_SQL, row).lastrowid
+        if receipt_text:
+            conn.execute(self.RECEIPT_TEXT_INSERT_SQL, (payment_id, compress_text(receipt_text)))
+        return payment_id
+
+    # Bound parameters per IN (...) lookup; older SQLite builds allow 999
+    ID_LOOKUP_CHUNK = 500
+
+    def insert_payments(self, conn, rows, receipt_texts):
+        # One executemany for the payments; their new ids are read back by file_hash, which
+        # every batch row has, to key one executemany into receipt_texts
+        first_new_id = conn.execute('SELECT COALESCE(MAX(payment_id), 0) + 1 FROM payments').fetchone()[0]
+        conn.executemany(self.PAYMENT_INSERT_SQL, rows)
+
+        texts = {row[5]: text for row, text in zip(rows, receipt_texts) if row[5] and text}
+        hashes = list(texts)
+        bodies = []
+        for start in range(0, len(hashes), self.ID_LOOKUP_CHUNK):
+            chunk = hashes[start:start + self.ID_LOOKUP_CHUNK]
+            cursor = conn.execute(
+                f"SELECT payment_id, file_hash FROM payments "
+                f"WHERE file_hash IN ({', '.join('?' * len(chunk))}) AND payment_id >= ?",
+                chunk + [first_new_id]
+            )
+            bodies.extend((payment_id, compress_text(texts[file_hash])) for payment_id, file_hash in cursor)
+        conn.executemany(self.RECEIPT_TEXT_INSERT_SQL, bodies)
 
-            cursor.execute('''
-                INSERT INTO payments (client_id, amount, payment_date, receipt_text, bank_name, created_date, file_hash, is_manual)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (client_id, amount, payment_date, receipt_text, bank_name,
-                  datetime.now().strftime('%d.%m.%Y'), file_hash, 1 if is_manual else 0))
+    def get_receipt_text(self, payment_id):
+        try:
+            row = self.db.connect().execute(
+                'SELECT body FROM receipt_texts WHERE payment_id = ?', (payment_id,)).fetchone()
+            return decompress_text(row[0]) if row else None
+        except Exception as e:
+            print(f"Receipt text retrieval error: {e}")
+            return None
 
-            conn.commit()
-            conn.close()
+    def add_payment(self, client_id, amount, payment_date, receipt_text, bank_name, file_hash, is_manual=False,
+                    fingerprint=None):
+        try:
+            with self.db.transaction() as conn:
+                self.insert_payment(conn, self.payment_row(
+                    client_id, amount, payment_date, bank_name, file_hash, is_manual, fingerprint), receipt_text)
             return True
         except Exception as e:
             print(f"Payment addition error: {e}")
@@ -284,16 +2225,13 @@ class AccountingWorkOptimizer:
         return self.add_payment(
             client_id, amount, payment_date,
             f"Manual payment: {description}",
-            "Manual entry", "", True
+            "Manual entry", None, True
         )
 
     def delete_payment(self, payment_id):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM payments WHERE payment_id = ?', (payment_id,))
-            conn.commit()
-            conn.close()
+            with self.db.transaction() as conn:
+                conn.execute('DELETE FROM payments WHERE payment_id = ?', (payment_id,))
             return True
         except Exception as e:
             print(f"Payment deletion error: {e}")
@@ -301,12 +2239,12 @@ class AccountingWorkOptimizer:
 
     def delete_client(self, client_id):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            cursor.execute('DELETE FROM payments WHERE client_id = ?', (client_id,))
-            cursor.execute('DELETE FROM clients WHERE client_id = ?', (client_id,))
-            conn.commit()
-            conn.close()
+            self.invalidate_client_index()
+            with self.db.transaction() as conn:
+                # Drop the balance row first so the per-payment delete triggers have nothing to update
+                conn.execute('DELETE FROM client_balances WHERE client_id = ?', (client_id,))
+                conn.execute('DELETE FROM payments WHERE client_id = ?', (client_id,))
+                conn.execute('DELETE FROM clients WHERE client_id = ?', (client_id,))
             return True
         except Exception as e:
             print(f"Client deletion error: {e}")
@@ -314,9 +2252,7 @@ class AccountingWorkOptimizer:
 
     def update_client(self, client_id, fio=None, phone=None, account=None, total_debt=None):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
+            self.invalidate_client_index()
             updates = []
             params = []
 
@@ -335,10 +2271,9 @@ class AccountingWorkOptimizer:
 
             if updates:
                 params.append(client_id)
-                cursor.execute(f'UPDATE clients SET {", ".join(updates)} WHERE client_id = ?', params)
+                with self.db.transaction() as conn:
+                    conn.execute(f'UPDATE clients SET {", ".join(updates)} WHERE client_id = ?', params)
 
-            conn.commit()
-            conn.close()
             return True
         except Exception as e:
             print(f"Client update error: {e}")
@@ -346,20 +2281,18 @@ class AccountingWorkOptimizer:
 
     def apply_discount(self, client_id, discount_amount):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            cursor.execute('SELECT total_debt FROM clients WHERE client_id = ?', (client_id,))
-            result = cursor.fetchone()
-            if not result:
-                return None
+            self.invalidate_client_index()
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('SELECT total_debt FROM clients WHERE client_id = ?', (client_id,))
+                result = cursor.fetchone()
+                if not result:
+                    return None
+
+                current_debt = result[0]
+                new_debt = max(0, current_debt - discount_amount)
+                cursor.execute('UPDATE clients SET total_debt = ? WHERE client_id = ?', (new_debt, client_id))
 
-            current_debt = result[0]
-            new_debt = max(0, current_debt - discount_amount)
-            cursor.execute('UPDATE clients SET total_debt = ? WHERE client_id = ?', (new_debt, client_id))
-
-            conn.commit()
-            conn.close()
             return new_debt
         except Exception as e:
             print(f"Discount application error: {e}")
@@ -367,64 +2300,256 @@ class AccountingWorkOptimizer:
 
     def get_client_info(self, client_id):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+            cursor = self.db.connect().cursor()
             cursor.execute('SELECT * FROM clients WHERE client_id = ?', (client_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result
+            return cursor.fetchone()
         except Exception as e:
             print(f"Client info retrieval error: {e}")
             return None
 
     def get_all_clients(self):
+        return self.query_clients(self.CLIENT_TABLE_COLUMNS)
+
+    def get_all_payments(self):
+        return self.query_payments(self.PAYMENT_QUERY_ALL, descending=True)
+
+    # Query API: name -> SQL expression; every name can be projected, the *_ORDER ones also sorted
+    # and paged by keyset (they are never NULL and have an index behind them)
+    CLIENT_QUERY_COLUMNS = {
+        'client_id': 'c.client_id',
+        'fio': 'c.fio',
+        'phone': 'c.phone',
+        'account': 'c.account',
+        'total_debt': 'c.total_debt',
+        'created_date': 'c.created_date',
+        'paid_total': 'COALESCE(b.paid_total, 0)',
+        'payment_count': 'COALESCE(b.payment_count, 0)',
+        'last_payment_date': 'b.last_payment_date',
+        'remaining_debt': 'COALESCE(b.remaining_debt, c.total_debt)',
+    }
+    CLIENT_QUERY_FROM = 'FROM clients c LEFT JOIN client_balances b ON b.client_id = c.client_id'
+    CLIENT_QUERY_ORDER = ('fio', 'client_id', 'total_debt')
+    CLIENT_TABLE_COLUMNS = ['client_id', 'fio', 'phone', 'account', 'total_debt', 'created_date']
+
+    PAYMENT_QUERY_COLUMNS = {
+        'payment_id': 'p.payment_id',
+        'client_id': 'p.client_id',
+        'amount': 'p.amount',
+        'amount_kopecks': 'p.amount_kopecks',
+        'payment_date': 'p.payment_date',
+        'bank_name': 'p.bank_name',
+        'is_manual': 'p.is_manual',
+        'file_hash': 'p.file_hash',
+        'created_date': 'p.created_date',
+        'receipt_text': '(SELECT inflate(r.body) FROM receipt_texts r WHERE r.payment_id = p.payment_id)',
+        'fio': 'c.fio',
+    }
+    PAYMENT_QUERY_FROM = 'FROM payments p LEFT JOIN clients c ON p.client_id = c.client_id'
+    PAYMENT_QUERY_ORDER = ('payment_date', 'payment_id', 'amount_kopecks')
+    PAYMENT_QUERY_ALL = list(PAYMENT_QUERY_COLUMNS)
+    PAYMENT_QUERY_DEFAULT = [name for name in PAYMENT_QUERY_COLUMNS if name != 'receipt_text']
+
+    def build_query(self, query_columns, from_sql, id_name, sortable, columns, clauses, params,
+                    order_by, descending, limit, offset, after):
+        unknown = [name for name in columns if name not in query_columns]
+        if unknown:
+            raise ValueError(f"Unknown columns: {', '.join(unknown)}")
+        if order_by not in sortable:
+            raise ValueError(f"Cannot order by {order_by}; choose one of {', '.join(sortable)}")
+
+        # The cursor for the next page is read from the last row, so the sort and id columns always come back
+        columns = list(columns) + [name for name in dict.fromkeys((order_by, id_name)) if name not in columns]
+        sort_expr, id_expr = query_columns[order_by], query_columns[id_name]
+        clauses, params = list(clauses), list(params)
+        order = 'DESC' if descending else 'ASC'
+        if after is not None:
+            clauses.append(f"({sort_expr}, {id_expr}) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+
+        sql = (f"SELECT {', '.join(f'{query_columns[name]} AS {name}' for name in columns)} {from_sql} "
+               f"{'WHERE ' + ' AND '.join(clauses) if clauses else ''} "
+               f"ORDER BY {sort_expr} {order}, {id_expr} {order}")
+        if limit is not None or offset:
+            sql += ' LIMIT ? OFFSET ?'
+            params.extend([-1 if limit is None else int(limit), int(offset or 0)])
+        return sql, params
+
+    def run_query(self, sql, params, chunksize, label):
         try:
-            conn = sqlite3.connect(self.db_file)
-            clients_df = pd.read_sql('SELECT * FROM clients ORDER BY fio', conn)
-            conn.close()
-            return clients_df
+            return pd.read_sql(sql, self.db.connect(), params=params, chunksize=chunksize)
+        except Exception as e:
+            print(f"{label} retrieval error: {e}")
+            return iter(()) if chunksize else pd.DataFrame()
+
+    def query_clients(self, columns=None, order_by='fio', descending=False, limit=None, offset=None, after=None,
+                      chunksize=None, client_id=None, search=None, debt_min=None, debt_max=None):
+        # Returns a DataFrame, or an iterator of DataFrames when chunksize is given;
+        # pass query_cursor(last_frame, order_by, 'client_id') as `after` to continue from a page
+        clauses, params = [], []
+        if client_id is not None:
+            clauses.append('c.client_id = ?')
+            params.append(int(client_id))
+        if search:
+            clauses.append('instr(fold(c.fio), ?) > 0')
+            params.append(fold_text(search))
+        if debt_min is not None:
+            clauses.append(f"{self.CLIENT_QUERY_COLUMNS['remaining_debt']} >= ?")
+            params.append(debt_min)
+        if debt_max is not None:
+            clauses.append(f"{self.CLIENT_QUERY_COLUMNS['remaining_debt']} <= ?")
+            params.append(debt_max)
+        sql, params = self.build_query(self.CLIENT_QUERY_COLUMNS, self.CLIENT_QUERY_FROM, 'client_id',
+                                       self.CLIENT_QUERY_ORDER, columns or list(self.CLIENT_QUERY_COLUMNS),
+                                       clauses, params, order_by, descending, limit, offset, after)
+        return self.run_query(sql, params, chunksize, "Clients")
+
+    def query_payments(self, columns=None, order_by='payment_date', descending=False, limit=None, offset=None,
+                       after=None, chunksize=None, **filters):
+        # Filters: client_id, date_from, date_to, bank, manual, amount_min, amount_max (see payment_filter).
+        # receipt_text is only read when asked for in `columns`
+        clauses, params = self.payment_filter(**filters)
+        sql, params = self.build_query(self.PAYMENT_QUERY_COLUMNS, self.PAYMENT_QUERY_FROM, 'payment_id',
+                                       self.PAYMENT_QUERY_ORDER, columns or self.PAYMENT_QUERY_DEFAULT,
+                                       clauses, params, order_by, descending, limit, offset, after)
+        return self.run_query(sql, params, chunksize, "Payments")
+
+    @staticmethod
+    def query_cursor(frame, order_by, id_name):
+        if frame.empty:
+            return None
+        # tolist() hands back Python scalars, which sqlite3 can bind (numpy ints it cannot)
+        return frame[order_by].iloc[-1:].tolist()[0], frame[id_name].iloc[-1:].tolist()[0]
+
+    CLIENT_BROWSE_SELECT = 'c.client_id, c.fio, c.phone, c.account, c.total_debt'
+    CLIENT_BROWSE_FROM = 'FROM clients c'
+    CLIENT_BROWSE_SEARCH = ("(instr(fold(c.fio), ?) > 0 OR instr(fold(COALESCE(c.phone, '')), ?) > 0 "
+                            "OR instr(fold(COALESCE(c.account, '')), ?) > 0)")
+    PAYMENT_BROWSE_SELECT = 'p.payment_id, c.fio, p.amount, p.payment_date, p.bank_name, p.is_manual'
+    PAYMENT_BROWSE_FROM = 'FROM payments p LEFT JOIN clients c ON p.client_id = c.client_id'
+    # Names are folded once per client rather than once per payment
+    PAYMENT_BROWSE_SEARCH = ("(p.client_id IN (SELECT client_id FROM clients WHERE instr(fold(fio), ?) > 0) "
+                             "OR instr(lower(COALESCE(p.bank_name, '')), ?) > 0 OR instr(p.payment_date, ?) > 0)")
+
+    def client_sort_columns(self):
+        return {
+            'client_id': 'c.client_id',
+            'fio': 'c.fio',
+            'phone': "COALESCE(c.phone, '')",
+            'account': "COALESCE(c.account, '')",
+            'total_debt': 'c.total_debt',
+        }
+
+    def payment_sort_columns(self):
+        return {
+            'payment_id': 'p.payment_id',
+            'fio': "COALESCE(c.fio, '')",
+            'amount': 'p.amount_kopecks',
+            'payment_date': self.date_key_sql('p.payment_date'),
+            'bank_name': "COALESCE(p.bank_name, '')",
+            'is_manual': 'p.is_manual',
+        }
+
+    def browse_filter(self, search_sql, search, sort_expr=None, id_column=None, descending=False, after=None):
+        conditions = []
+        params = []
+        if search:
+            conditions.append(search_sql)
+            params.extend([fold_text(search)] * search_sql.count('?'))
+        if after is not None:
+            conditions.append(f"({sort_expr}, {id_column}) {'<' if descending else '>'} (?, ?)")
+            params.extend(after)
+        return (f"WHERE {' AND '.join(conditions)}" if conditions else ""), params
+
+    def browse_page(self, select, from_sql, search_sql, sort_columns, id_column,
+                    sort, descending, search, after, limit):
+        # Rows end with their sort key so the caller can ask for the page after (sort key, id)
+        sort_expr = sort_columns.get(sort, id_column)
+        where, params = self.browse_filter(search_sql, search, sort_expr, id_column, descending, after)
+        order = 'DESC' if descending else 'ASC'
+        cursor = self.db.connect().execute(
+            f"SELECT {select}, {sort_expr} {from_sql} {where} "
+            f"ORDER BY {sort_expr} {order}, {id_column} {order} LIMIT ?",
+            params + [int(limit)]
+        )
+        return cursor.fetchall()
+
+    def browse_clients(self, sort='fio', descending=False, search='', after=None, limit=500):
+        try:
+            return self.browse_page(self.CLIENT_BROWSE_SELECT, self.CLIENT_BROWSE_FROM, self.CLIENT_BROWSE_SEARCH,
+                                    self.client_sort_columns(), 'c.client_id',
+                                    sort, descending, search, after, limit)
         except Exception as e:
             print(f"Clients retrieval error: {e}")
-            return pd.DataFrame()
+            return []
 
-    def get_all_payments(self):
+    def browse_payments(self, sort='payment_date', descending=True, search='', after=None, limit=500):
         try:
-            conn = sqlite3.connect(self.db_file)
-            payments_df = pd.read_sql('''
-                SELECT p.*, c.fio 
-                FROM payments p 
-                LEFT JOIN clients c ON p.client_id = c.client_id 
-                ORDER BY p.payment_date DESC
-            ''', conn)
-            conn.close()
-            return payments_df
+            return self.browse_page(self.PAYMENT_BROWSE_SELECT, self.PAYMENT_BROWSE_FROM, self.PAYMENT_BROWSE_SEARCH,
+                                    self.payment_sort_columns(), 'p.payment_id',
+                                    sort, descending, search, after, limit)
         except Exception as e:
             print(f"Payments retrieval error: {e}")
-            return pd.DataFrame()
+            return []
 
-    def calculate_remaining_debt(self, client_id):
+    def count_rows(self, from_sql, search_sql, search):
+        where, params = self.browse_filter(search_sql, search)
+        return self.db.connect().execute(f"SELECT COUNT(*) {from_sql} {where}", params).fetchone()[0]
+
+    def count_clients(self, search=''):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
+            return self.count_rows(self.CLIENT_BROWSE_FROM, self.CLIENT_BROWSE_SEARCH, search)
+        except Exception as e:
+            print(f"Clients count error: {e}")
+            return 0
 
-            cursor.execute('SELECT total_debt FROM clients WHERE client_id = ?', (client_id,))
-            result = cursor.fetchone()
-            if not result:
-                return 0
+    def count_payments(self, search=''):
+        try:
+            return self.count_rows('FROM payments p', self.PAYMENT_BROWSE_SEARCH, search)
+        except Exception as e:
+            print(f"Payments count error: {e}")
+            return 0
 
-            total_debt = result[0]
+    def get_client_summary(self):
+        try:
+            return pd.read_sql('''
+                SELECT c.*,
+                       COALESCE(b.paid_total, 0) AS Paid,
+                       COALESCE(b.remaining_debt, c.total_debt) AS Remaining_Debt,
+                       COALESCE(b.payment_count, 0) AS Payment_Count
+                FROM clients c
+                LEFT JOIN client_balances b ON b.client_id = c.client_id
+                ORDER BY c.fio
+            ''', self.db.connect())
+        except Exception as e:
+            print(f"Client summary retrieval error: {e}")
+            return pd.DataFrame()
 
-            cursor.execute('SELECT SUM(amount) FROM payments WHERE client_id = ?', (client_id,))
-            total_payments_result = cursor.fetchone()
-            total_payments = total_payments_result[0] if total_payments_result[0] is not None else 0
+    def get_client_balance(self, client_id):
+        cursor = self.db.connect().cursor()
+        cursor.execute('''
+            SELECT paid_total, payment_count, last_payment_date, remaining_debt
+            FROM client_balances WHERE client_id = ?
+        ''', (client_id,))
+        return cursor.fetchone()
 
-            conn.close()
-            return total_debt - total_payments
+    def calculate_remaining_debt(self, client_id):
+        try:
+            result = self.get_client_balance(client_id)
+            return result[3] if result else 0
         except Exception as e:
             print(f"Debt calculation error: {e}")
             return 0
 
     def ask_for_debt_info(self, fio):
+        if self.debt_prompt is not None:
+            return self.debt_prompt(fio)
+        if self.new_client_policy == 'default':
+            return self.default_debt
+        if self.new_client_policy in ('pending', 'skip'):
+            return None
+        return self.ask_debt_dialog(fio)
+
+    def ask_debt_dialog(self, fio):
         try:
             response = messagebox.askyesno(
                 "New Client",
@@ -444,20 +2569,117 @@ class AccountingWorkOptimizer:
             print(f"Debt info request error: {e}")
             return None
 
+    def extract_entities_cached(self, text, file_hash=None):
+        cache = self.extraction_cache
+        if cache is None or not file_hash:
+            return self.analyzer.extract_entities(text)
+
+        extracted_data = cache.get_entities(file_hash, self.analyzer.PARSER_VERSION)
+        if extracted_data is None:
+            extracted_data = self.analyzer.extract_entities(text)
+            cache.put_entities(file_hash, self.analyzer.PARSER_VERSION, extracted_data)
+        return extracted_data
+
+    def parse_receipt(self, text, filename, file_hash=None):
+        with self.metrics.time('parse'):
+            extracted_data = self.extract_entities_cached(text, file_hash)
+        if not extracted_data:
+            return None, f"❌ {filename}: Failed to recognize receipt data"
+
+        if 'fio' not in extracted_data:
+            return None, f"❌ {filename}: Failed to determine name"
+
+        if 'amount' not in extracted_data or extracted_data['amount'] <= 0:
+            return None, f"❌ {filename}: Failed to determine amount"
+
+        return extracted_data, None
+
+    PENDING_INSERT_SQL = '''
+        INSERT OR IGNORE INTO pending_receipts (file_hash, filename, fio, phone, account, amount,
+                                                payment_date, bank_name, receipt_text, created_date,
+                                                receipt_fingerprint)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    '''
+
+    def pending_row(self, filename, file_hash, text, extracted_data):
+        return (file_hash, filename, extracted_data['fio'], extracted_data.get('phone', ''),
+                extracted_data.get('account', ''), extracted_data['amount'],
+                iso_date(extracted_data.get('date')) or date.today().isoformat(),
+                extracted_data['bank'], text, datetime.now().strftime('%d.%m.%Y'),
+                receipt_fingerprint(extracted_data))
+
+    def pending_result(self, filename, extracted_data):
+        return f"⏳ {filename}: Queued for review - {extracted_data['fio']}"
+
+    def queue_pending_receipt(self, filename, file_hash, text, extracted_data):
+        with self.db.transaction() as conn:
+            conn.execute(self.PENDING_INSERT_SQL, self.pending_row(filename, file_hash, text, extracted_data))
+        return self.pending_result(filename, extracted_data)
+
+    def get_pending_receipts(self):
+        try:
+            return pd.read_sql('''
+                SELECT pending_id, filename, fio, phone, account, amount, payment_date, bank_name, created_date
+                FROM pending_receipts ORDER BY pending_id
+            ''', self.db.connect())
+        except Exception as e:
+            print(f"Pending receipts retrieval error: {e}")
+            return pd.DataFrame()
+
+    def approve_pending_receipt(self, pending_id, total_debt):
+        try:
+            with self.db.transaction() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    SELECT file_hash, fio, phone, account, amount, payment_date, bank_name, receipt_text,
+                           receipt_fingerprint
+                    FROM pending_receipts WHERE pending_id = ?
+                ''', (pending_id,))
+                row = cursor.fetchone()
+                if not row:
+                    return None
+
+                file_hash, fio, phone, account, amount, payment_date, bank_name, receipt_text, fingerprint = row
+                result = self.find_client(fio, phone, account)
+                new_client = not result
+                if result:
+                    client_id = result[0]
+                else:
+                    client_id = self.insert_client(conn, fio, phone, account, total_debt)
+                self.insert_payment(conn, self.payment_row(
+                    client_id, amount, payment_date, bank_name, file_hash, fingerprint=fingerprint), receipt_text)
+                conn.execute('DELETE FROM pending_receipts WHERE pending_id = ?', (pending_id,))
+            if new_client:
+                self.index_client(client_id, fio, phone, account, total_debt)
+            return client_id
+        except Exception as e:
+            print(f"Pending receipt approval error: {e}")
+            return None
+
+    def discard_pending_receipt(self, pending_id):
+        try:
+            with self.db.transaction() as conn:
+                cursor = conn.execute('DELETE FROM pending_receipts WHERE pending_id = ?', (pending_id,))
+            return cursor.rowcount > 0
+        except Exception as e:
+            print(f"Pending receipt deletion error: {e}")
+            return False
+
     def process_receipt(self, text, filename, file_hash):
         try:
             if self.is_duplicate_file(file_hash):
                 return f"⏭️ {filename}: Skipped (already processed)"
 
-            extracted_data = self.analyzer.extract_entities(text)
-            if not extracted_data:
-                return f"❌ {filename}: Failed to recognize receipt data"
-
-            if 'fio' not in extracted_data:
-                return f"❌ {filename}: Failed to determine name"
+            extracted_data, error = self.parse_receipt(text, filename, file_hash)
+            if error:
+                return error
 
-            if 'amount' not in extracted_data or extracted_data['amount'] <= 0:
-                return f"❌ {filename}: Failed to determine amount"
+            fingerprint = receipt_fingerprint(extracted_data)
+            with self.metrics.time('dedup'):
+                duplicate = self.find_duplicate_receipt(
+                    fingerprint, receipt_fingerprint(extracted_data, legacy=True))
+            if duplicate:
+                return f"⏭️ {filename}: Skipped (same payment as {duplicate})"
 
             client_id, total_debt = self.find_or_create_client(
                 extracted_data['fio'],
@@ -466,91 +2688,359 @@ class AccountingWorkOptimizer:
             )
 
             if client_id is None:
+                if self.new_client_policy == 'pending' and self.debt_prompt is None:
+                    return self.queue_pending_receipt(filename, file_hash, text, extracted_data)
                 return f"⏸️ {filename}: Skipped - {extracted_data['fio']}"
 
-            success = self.add_payment(
-                client_id,
-                extracted_data['amount'],
-                extracted_data.get('date', datetime.now().strftime('%d.%m.%Y')),
-                text[:500],
-                extracted_data['bank'],
-                file_hash
-            )
+            with self.metrics.time('insert'):
+                success = self.add_payment(
+                    client_id,
+                    extracted_data['amount'],
+                    extracted_data.get('date', datetime.now().strftime('%d.%m.%Y')),
+                    text,
+                    extracted_data['bank'],
+                    file_hash,
+                    fingerprint=fingerprint
+                )
 
             if not success:
                 return f"❌ {filename}: Payment save error"
 
-            remaining_debt = self.calculate_remaining_debt(client_id)
+            with self.metrics.time('balance'):
+                remaining_debt = self.calculate_remaining_debt(client_id)
 
             return f"✅ {extracted_data['fio']}: payment {extracted_data['amount']} rub. (remaining: {remaining_debt:.2f} rub.)"
 
         except Exception as e:
             print(f"Receipt processing critical error: {e}")
+            self.metrics.increment('errors', stage='process')
             return f"❌ {filename}: Processing error - {str(e)}"
 
-    def process_pdf_files(self, pdf_files):
-        results = []
+    def process_extracted_file(self, pdf_file, file_hash, text):
+        filename = os.path.basename(pdf_file)
+        if not file_hash:
+            return f"❌ {filename}: file read error"
 
-        for pdf_file in pdf_files:
-            file_hash = self.calculate_file_hash(pdf_file)
-            if not file_hash:
-                results.append(f"❌ {os.path.basename(pdf_file)}: file read error")
-                continue
+        if text is None:
+            return f"⏭️ {filename}: Skipped (already processed)"
+
+        if not text.strip():
+            return f"❌ {filename}: failed to extract text"
+
+        return self.process_receipt(text, filename, file_hash)
+
+    def is_cancelled(self, cancel_event):
+        return cancel_event is not None and cancel_event.is_set()
+
+    def cancelled_result(self, pdf_file):
+        return f"🚫 {os.path.basename(pdf_file)}: Cancelled"
 
-            text = self.extract_text_from_pdf(pdf_file)
-            if not text.strip():
-                results.append(f"❌ {os.path.basename(pdf_file)}: failed to extract text")
+    def process_pdf_files(self, pdf_files, bulk=False, progress=None, cancel_event=None, profile=None):
+        # profile: None, 'cprofile' or 'tracemalloc'; the report lands in self.last_profile
+        pdf_files = list(pdf_files)
+        # Other processes may have added clients since the last batch
+        self.invalidate_client_index()
+
+        report = {}
+        with profiled(profile, report), self.metrics.time('batch', items=len(pdf_files)):
+            if bulk:
+                results = self.process_pdf_files_bulk(pdf_files, progress, cancel_event)
+            else:
+                results = self.process_pdf_files_serial(pdf_files, progress, cancel_event)
+        self.last_profile = report.get('text')
+
+        for result in results:
+            self.metrics.record_result(result)
+        return results
+
+    def process_pdf_files_serial(self, pdf_files, progress=None, cancel_event=None):
+        results = [None] * len(pdf_files)
+
+        with closing(self.iter_extracted(pdf_files)) as extracted:
+            for index, pdf_file, file_hash, text in extracted:
+                if self.is_cancelled(cancel_event):
+                    break
+
+                results[index] = self.process_extracted_file(pdf_file, file_hash, text)
+                if progress:
+                    progress(index, results[index])
+
+        for index, result in enumerate(results):
+            if result is None:
+                results[index] = self.cancelled_result(pdf_files[index])
+                if progress:
+                    progress(index, results[index])
+
+        return results
+
+    def process_pdf_files_bulk(self, pdf_files, progress=None, cancel_event=None):
+        pdf_files = list(pdf_files)
+        results = [None] * len(pdf_files)
+        parsed = []
+        batch_hashes = set()
+        # Receipt fingerprint -> file name, so a transfer uploaded twice in one batch is caught without a query
+        batch_fingerprints = {}
+
+        def report(index, result):
+            results[index] = result
+            if progress:
+                progress(index, result)
+
+        def cancel_pending():
+            for index, pdf_file in enumerate(pdf_files):
+                if results[index] is None or results[index].startswith("📄"):
+                    report(index, self.cancelled_result(pdf_file))
+            return results
+
+        with closing(self.iter_extracted(pdf_files)) as extracted:
+            for index, pdf_file, file_hash, text in extracted:
+                if self.is_cancelled(cancel_event):
+                    return cancel_pending()
+
+                filename = os.path.basename(pdf_file)
+                if not file_hash:
+                    report(index, f"❌ {filename}: file read error")
+                    continue
+
+                if text is None or file_hash in batch_hashes:
+                    report(index, f"⏭️ {filename}: Skipped (already processed)")
+                    continue
+
+                if not text.strip():
+                    report(index, f"❌ {filename}: failed to extract text")
+                    continue
+
+                try:
+                    extracted_data, error = self.parse_receipt(text, filename, file_hash)
+                except Exception as e:
+                    print(f"Receipt processing critical error: {e}")
+                    self.metrics.increment('errors', stage='parse')
+                    extracted_data, error = None, f"❌ {filename}: Processing error - {str(e)}"
+                if error:
+                    report(index, error)
+                    continue
+
+                fingerprint = receipt_fingerprint(extracted_data)
+                with self.metrics.time('dedup'):
+                    duplicate = batch_fingerprints.get(fingerprint) or self.find_duplicate_receipt(
+                        fingerprint, receipt_fingerprint(extracted_data, legacy=True))
+                if duplicate:
+                    report(index, f"⏭️ {filename}: Skipped (same payment as {duplicate})")
+                    continue
+                if fingerprint:
+                    batch_fingerprints[fingerprint] = filename
+
+                batch_hashes.add(file_hash)
+                parsed.append((index, filename, file_hash, text, extracted_data))
+                report(index, f"📄 {filename}: Parsed, waiting for batch commit")
+
+        # Receipt identities resolve to an existing client_id or to a provisional (negative) id
+        # for a client created in this batch; fuzzy variants of a new name share one provisional id
+        client_refs = {}
+        new_clients = {}
+        new_index = ClientIndex(self.match_threshold)
+        accepted = []
+        pending = []
+        queue_unknown = self.new_client_policy == 'pending' and self.debt_prompt is None
+        for index, filename, file_hash, text, extracted_data in parsed:
+            if self.is_cancelled(cancel_event):
+                return cancel_pending()
+
+            key = (extracted_data['fio'], extracted_data.get('phone', ''), extracted_data.get('account', ''))
+            if key not in client_refs:
+                try:
+                    result = self.find_client(*key) or new_index.resolve(*key)
+                except Exception as e:
+                    print(f"Client search/creation error: {e}")
+                    self.metrics.increment('errors', stage='resolve')
+                    result = None
+                if result:
+                    client_refs[key] = result[0]
+                else:
+                    provisional_id = -(len(new_clients) + 1)
+                    new_clients[provisional_id] = (key, self.ask_for_debt_info(key[0]))
+                    new_index.add(provisional_id, *key, None)
+                    client_refs[key] = provisional_id
+
+            client_ref = client_refs[key]
+            if client_ref < 0 and new_clients[client_ref][1] is None:
+                if queue_unknown:
+                    pending.append((index, filename, file_hash, text, extracted_data))
+                else:
+                    report(index, f"⏸️ {filename}: Skipped - {extracted_data['fio']}")
                 continue
+            accepted.append((index, filename, file_hash, text, extracted_data, client_ref))
 
-            result = self.process_receipt(text, os.path.basename(pdf_file), file_hash)
-            results.append(result)
+        if self.is_cancelled(cancel_event):
+            return cancel_pending()
+
+        client_ids = {}
+        try:
+            with self.metrics.time('insert', items=len(accepted) + len(pending)), self.db.transaction() as conn:
+                for provisional_id, (key, total_debt) in new_clients.items():
+                    if total_debt is not None:
+                        client_ids[provisional_id] = self.insert_client(conn, *key, total_debt)
+
+                self.insert_payments(conn, [
+                    self.payment_row(
+                        client_ids.get(client_ref, client_ref),
+                        extracted_data['amount'],
+                        extracted_data.get('date', datetime.now().strftime('%d.%m.%Y')),
+                        extracted_data['bank'],
+                        file_hash,
+                        fingerprint=receipt_fingerprint(extracted_data)
+                    )
+                    for _, _, file_hash, text, extracted_data, client_ref in accepted
+                ], [text for _, _, _, text, _, _ in accepted])
+
+                if pending:
+                    conn.executemany(self.PENDING_INSERT_SQL, [
+                        self.pending_row(filename, file_hash, text, extracted_data)
+                        for _, filename, file_hash, text, extracted_data in pending
+                    ])
+        except Exception as e:
+            print(f"Bulk ingest error: {e}")
+            self.metrics.increment('errors', stage='insert')
+            for index, filename, *_ in accepted + pending:
+                report(index, f"❌ {filename}: Batch rolled back - {str(e)}")
+            return results
+
+        for provisional_id, client_id in client_ids.items():
+            key, total_debt = new_clients[provisional_id]
+            self.index_client(client_id, *key, total_debt)
+
+        for index, filename, file_hash, text, extracted_data in pending:
+            report(index, self.pending_result(filename, extracted_data))
+
+        remaining_debts = {}
+        for index, filename, file_hash, text, extracted_data, client_ref in accepted:
+            client_id = client_ids.get(client_ref, client_ref)
+            if client_id not in remaining_debts:
+                with self.metrics.time('balance'):
+                    remaining_debts[client_id] = self.calculate_remaining_debt(client_id)
+            report(index, f"✅ {extracted_data['fio']}: payment {extracted_data['amount']} rub. "
+                          f"(remaining: {remaining_debts[client_id]:.2f} rub.)")
 
         return results
 
     def get_database_stats(self):
+        # Read from the trigger-maintained counters; rebuild_statistics() recounts from scratch
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-
-            cursor.execute('SELECT COUNT(*) FROM clients')
-            total_clients = cursor.fetchone()[0]
+            cursor = self.db.connect().cursor()
 
-            cursor.execute('SELECT COUNT(*) FROM payments')
-            total_payments = cursor.fetchone()[0]
+            cursor.execute("SELECT value FROM stat_counters WHERE name = 'clients'")
+            result = cursor.fetchone()
+            total_clients = result[0] if result else 0
 
-            cursor.execute('SELECT SUM(amount) FROM payments')
-            total_amount_result = cursor.fetchone()
-            total_amount = total_amount_result[0] if total_amount_result[0] is not None else 0
+            cursor.execute('SELECT COALESCE(SUM(payment_count), 0), COALESCE(SUM(amount_kopecks), 0) / 100.0 FROM payment_stats')
+            total_payments, total_amount = cursor.fetchone()
 
-            conn.close()
             return total_clients, total_payments, total_amount
         except Exception as e:
             print(f"Statistics retrieval error: {e}")
             return 0, 0, 0
 
-    def export_to_excel(self):
+    def get_payment_breakdown(self, by='bank'):
+        column = {'bank': 'bank_name', 'month': 'month'}[by]
+        try:
+            return pd.read_sql(f'''
+                SELECT {column} AS {by},
+                       SUM(payment_count) AS payment_count,
+                       SUM(amount_kopecks) / 100.0 AS amount_total
+                FROM payment_stats
+                GROUP BY {column}
+                ORDER BY {column}
+            ''', self.db.connect())
+        except Exception as e:
+            print(f"Statistics retrieval error: {e}")
+            return pd.DataFrame()
+
+    def range_bound(self, value, upper=False):
+        # A bare YYYY-MM covers the whole month; ISO text compares correctly against day 31 of any month
+        match = ISO_MONTH_RE.match(str(value).strip())
+        if match and 1 <= int(match.group(2)) <= 12:
+            year, month = match.groups()
+            return f"{year}-{int(month):02d}-{'31' if upper else '01'}"
+        bound = iso_date(value)
+        if bound is None:
+            raise ValueError(f"Unrecognized date: {value}")
+        return bound
+
+    def payment_filter(self, client_id=None, date_from=None, date_to=None, bank=None, manual=None,
+                       amount_min=None, amount_max=None):
+        # Date bounds are inclusive and take ISO or DD.MM.YYYY dates, or YYYY-MM months; amounts are rubles
+        clauses, params = [], []
+        if client_id is not None:
+            clauses.append('p.client_id = ?')
+            params.append(int(client_id))
+        if date_from is not None:
+            clauses.append('p.payment_date >= ?')
+            params.append(self.range_bound(date_from))
+        if date_to is not None:
+            clauses.append('p.payment_date <= ?')
+            params.append(self.range_bound(date_to, upper=True))
+        if bank is not None:
+            clauses.append('p.bank_name = ?')
+            params.append(bank)
+        if manual is not None:
+            clauses.append('p.is_manual = ?')
+            params.append(1 if manual else 0)
+        if amount_min is not None:
+            clauses.append('p.amount_kopecks >= ?')
+            params.append(to_kopecks(amount_min))
+        if amount_max is not None:
+            clauses.append('p.amount_kopecks <= ?')
+            params.append(to_kopecks(amount_max))
+        return clauses, params
+
+    def get_payments_between(self, date_from=None, date_to=None, client_id=None):
+        return self.query_payments(self.PAYMENT_QUERY_ALL, client_id=client_id, date_from=date_from, date_to=date_to)
+
+    def get_payment_totals_between(self, date_from=None, date_to=None, by='month', **filters):
+        # Reconciliation totals; day and month groups are answered from idx_payments_date alone
+        group = {
+            'day': 'p.payment_date',
+            'month': self.month_key_sql('p.payment_date'),
+            'bank': "COALESCE(p.bank_name, '')",
+            None: "'total'",
+        }[by]
+        clauses, params = self.payment_filter(date_from=date_from, date_to=date_to, **filters)
+        where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
         try:
-            clients_df = self.get_all_clients()
-            payments_df = self.get_all_payments()
+            return pd.read_sql(f'''
+                SELECT {group} AS period,
+                       COUNT(*) AS payment_count,
+                       COALESCE(SUM(p.amount_kopecks), 0) / 100.0 AS amount_total
+                FROM payments p
+                {where}
+                GROUP BY 1
+                ORDER BY 1
+            ''', self.db.connect(), params=params).rename(columns={'period': by or 'period'})
+        except Exception as e:
+            print(f"Statistics retrieval error: {e}")
+            return pd.DataFrame()
+
+    def has_report_data(self):
+        cursor = self.db.connect().cursor()
+        cursor.execute('SELECT EXISTS (SELECT 1 FROM clients) OR EXISTS (SELECT 1 FROM payments)')
+        return bool(cursor.fetchone()[0])
+
+    def export_report(self, file_path):
+        clients_export = self.get_client_summary()
+        payment_count, payment_lengths = self.payment_column_lengths()
+
+        if clients_export.empty and not payment_count:
+            return False
 
-            if clients_df.empty and payments_df.empty:
+        self.create_beautiful_excel(file_path, clients_export, self.iter_payment_chunks(), payment_lengths)
+        return True
+
+    def export_to_excel(self):
+        try:
+            if not self.has_report_data():
                 messagebox.showinfo("Information", "No data to export")
                 return False
 
-            if not clients_df.empty:
-                clients_export = clients_df.copy()
-                clients_export['Paid'] = clients_export['client_id'].apply(
-                    lambda x: self.get_total_payments(x)
-                )
-                clients_export['Remaining_Debt'] = clients_export['client_id'].apply(
-                    lambda x: self.calculate_remaining_debt(x)
-                )
-                clients_export['Payment_Count'] = clients_export['client_id'].apply(
-                    lambda x: self.get_payment_count(x)
-                )
-            else:
-                clients_export = pd.DataFrame()
-
             file_path = filedialog.asksaveasfilename(
                 title="Save Excel Report",
                 defaultextension=".xlsx",
@@ -558,8 +3048,7 @@ class AccountingWorkOptimizer:
             )
 
             if file_path:
-                self.create_beautiful_excel(file_path, clients_export, payments_df)
-                return True
+                return self.export_report(file_path)
             return False
 
         except Exception as e:
@@ -569,138 +3058,114 @@ class AccountingWorkOptimizer:
 
     def get_total_payments(self, client_id):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            cursor.execute('SELECT SUM(amount) FROM payments WHERE client_id = ?', (client_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result[0] if result[0] is not None else 0
+            result = self.get_client_balance(client_id)
+            return result[0] if result else 0
         except:
             return 0
 
     def get_payment_count(self, client_id):
         try:
-            conn = sqlite3.connect(self.db_file)
-            cursor = conn.cursor()
-            cursor.execute('SELECT COUNT(*) FROM payments WHERE client_id = ?', (client_id,))
-            result = cursor.fetchone()
-            conn.close()
-            return result[0] if result[0] is not None else 0
+            result = self.get_client_balance(client_id)
+            return result[1] if result else 0
         except:
             return 0
 
-    def create_beautiful_excel(self, file_path, clients_df, payments_df):
+    CLIENT_SHEET_COLUMNS = ['client_id', 'fio', 'phone', 'account', 'total_debt', 'Paid',
+                            'Remaining_Debt', 'Payment_Count', 'created_date']
+    CLIENT_SHEET_HEADERS = ["ID", "Name", "Phone", "Account", "Total Debt", "Paid", "Remaining Debt",
+                            "Payment Count", "Date Added"]
+    PAYMENT_SHEET_COLUMNS = ['payment_id', 'fio', 'amount', 'payment_date', 'bank_name', 'payment_type',
+                             'created_date']
+    PAYMENT_SHEET_HEADERS = ["ID", "Name", "Amount", "Payment Date", "Bank", "Type", "Date Added"]
+
+    def iter_payment_chunks(self, chunksize=50000):
+        return self.query_payments(['payment_id', 'fio', 'amount', 'payment_date', 'bank_name', 'is_manual',
+                                    'created_date'], descending=True, chunksize=chunksize)
+
+    def iter_payments_since(self, payment_id=0, chunksize=50000):
+        # Archive feed: payments after `payment_id` in id order, with their month partition key
+        return pd.read_sql(f'''
+            SELECT p.payment_id, p.client_id, c.fio, p.amount, p.payment_date, p.bank_name,
+                   p.is_manual, p.file_hash, p.created_date,
+                   {self.month_key_sql('p.payment_date')} AS month
+            FROM payments p
+            LEFT JOIN clients c ON p.client_id = c.client_id
+            WHERE p.payment_id > ?
+            ORDER BY p.payment_id
+        ''', self.db.connect(), params=(payment_id,), chunksize=chunksize)
+
+    def export_parquet(self, root, full=False):
+        archive = ParquetArchive(root)
+        if full:
+            archive.clear()
+        appended, state = archive.append_payments(self.iter_payments_since(archive.load_state()['payment_id']))
+        archive.write_clients(pd.read_sql('''
+            SELECT c.client_id, c.fio, c.phone, c.account, c.total_debt, c.created_date,
+                   COALESCE(b.paid_total, 0) AS paid_total,
+                   COALESCE(b.payment_count, 0) AS payment_count,
+                   COALESCE(b.remaining_debt, c.total_debt) AS remaining_debt
+            FROM clients c
+            LEFT JOIN client_balances b ON b.client_id = c.client_id
+            ORDER BY c.client_id
+        ''', self.db.connect()))
+        return appended, state
+
+    def payment_column_lengths(self):
+        cursor = self.db.connect().cursor()
+        cursor.execute('''
+            SELECT COUNT(*),
+                   MAX(LENGTH(p.payment_id)), MAX(LENGTH(COALESCE(c.fio, 'None'))), MAX(LENGTH(p.amount)),
+                   MAX(LENGTH(p.payment_date)), MAX(LENGTH(COALESCE(p.bank_name, 'None'))),
+                   MAX(CASE WHEN p.is_manual = 1 THEN 6 ELSE 4 END), MAX(LENGTH(COALESCE(p.created_date, 'None')))
+            FROM payments p
+            LEFT JOIN clients c ON p.client_id = c.client_id
+        ''')
+        count, *lengths = cursor.fetchone()
+        return count, [length or 0 for length in lengths]
+
+    def with_payment_type(self, frame):
+        return frame.assign(payment_type=frame['is_manual'].eq(1).map({True: 'Manual', False: 'Auto'}))
+
+    def create_beautiful_excel(self, file_path, clients_df, payments, payment_lengths=None):
         try:
-            wb = Workbook()
-
-            header_font = Font(bold=True, color="FFFFFF", size=12)
-            header_fill = PatternFill(start_color="2E75B6", end_color="2E75B6", fill_type="solid")
-            money_fill = PatternFill(start_color="E2EFDA", end_color="E2EFDA", fill_type="solid")
-            border = Border(left=Side(style='thin'), right=Side(style='thin'),
-                            top=Side(style='thin'), bottom=Side(style='thin'))
-            center_align = Alignment(horizontal='center', vertical='center')
-            left_align = Alignment(horizontal='left', vertical='center')
-            money_format = '#,##0.00" rub."'
-            date_format = 'DD.MM.YYYY'
+            writer = ExcelReportWriter()
 
             if not clients_df.empty:
-                ws_clients = wb.active
-                ws_clients.title = "Clients"
-
-                headers = ["ID", "Name", "Phone", "Account", "Total Debt", "Paid", "Remaining Debt",
-                           "Payment Count", "Date Added"]
-                for col, header in enumerate(headers, 1):
-                    cell = ws_clients.cell(row=1, column=col, value=header)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.border = border
-                    cell.alignment = center_align
-
-                for row, (_, client_row) in enumerate(clients_df.iterrows(), 2):
-                    for col, value in enumerate([client_row['client_id'], client_row['fio'],
-                                                 client_row['phone'], client_row['account'],
-                                                 client_row['total_debt'], client_row['Paid'],
-                                                 client_row['Remaining_Debt'], client_row['Payment_Count'],
-                                                 client_row['created_date']], 1):
-                        cell = ws_clients.cell(row=row, column=col, value=value)
-                        cell.border = border
-
-                        if col in [5, 6, 7]:
-                            if pd.notna(value):
-                                cell.number_format = money_format
-                                cell.fill = money_fill
-                            cell.alignment = center_align
-                        elif col == 9:
-                            cell.alignment = center_align
-                        else:
-                            cell.alignment = left_align
-
-                for column in ws_clients.columns:
-                    max_length = 0
-                    column_letter = get_column_letter(column[0].column)
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 30)
-                    ws_clients.column_dimensions[column_letter].width = adjusted_width
-
-                ws_clients.freeze_panes = 'A2'
-
-            if not payments_df.empty:
-                ws_payments = wb.create_sheet("Payment History")
-
-                headers = ["ID", "Name", "Amount", "Payment Date", "Bank", "Type", "Date Added"]
-                for col, header in enumerate(headers, 1):
-                    cell = ws_payments.cell(row=1, column=col, value=header)
-                    cell.font = header_font
-                    cell.fill = header_fill
-                    cell.border = border
-                    cell.alignment = center_align
-
-                for row, (_, payment_row) in enumerate(payments_df.iterrows(), 2):
-                    payment_type = "Manual" if payment_row['is_manual'] == 1 else "Auto"
-
-                    for col, value in enumerate([payment_row['payment_id'], payment_row['fio'],
-                                                 payment_row['amount'], payment_row['payment_date'],
-                                                 payment_row['bank_name'], payment_type,
-                                                 payment_row['created_date']], 1):
-                        cell = ws_payments.cell(row=row, column=col, value=value)
-                        cell.border = border
-
-                        if col == 3:
-                            if pd.notna(value):
-                                cell.number_format = money_format
-                                cell.fill = money_fill
-                            cell.alignment = center_align
-                        elif col in [4, 7]:
-                            cell.alignment = center_align
-                        elif col == 6:
-                            if value == 'Manual':
-                                cell.fill = PatternFill(start_color="FFF2CC", end_color="FFF2CC", fill_type="solid")
-                            else:
-                                cell.fill = PatternFill(start_color="E2F0D9", end_color="E2F0D9", fill_type="solid")
-                            cell.alignment = center_align
-                        else:
-                            cell.alignment = left_align
-
-                for column in ws_payments.columns:
-                    max_length = 0
-                    column_letter = get_column_letter(column[0].column)
-                    for cell in column:
-                        try:
-                            if len(str(cell.value)) > max_length:
-                                max_length = len(str(cell.value))
-                        except:
-                            pass
-                    adjusted_width = min(max_length + 2, 25)
-                    ws_payments.column_dimensions[column_letter].width = adjusted_width
-
-                ws_payments.freeze_panes = 'A2'
-
-            wb.save(file_path)
+                ws_clients = writer.add_sheet(
+                    "Clients", self.CLIENT_SHEET_HEADERS,
+                    column_widths(clients_df, self.CLIENT_SHEET_COLUMNS, self.CLIENT_SHEET_HEADERS, 30)
+                )
+                writer.append_frame(ws_clients, clients_df, self.CLIENT_SHEET_COLUMNS, [
+                    'report_text', 'report_text', 'report_text', 'report_text',
+                    'report_money', 'report_money', 'report_money', 'report_center', 'report_center'
+                ])
+
+            if isinstance(payments, pd.DataFrame):
+                payments = self.with_payment_type(payments) if not payments.empty else payments
+                widths = column_widths(payments, self.PAYMENT_SHEET_COLUMNS, self.PAYMENT_SHEET_HEADERS, 25)
+                chunks = [payments]
+            else:
+                chunks = payments
+                widths = [min(max(length, len(header)) + 2, 25)
+                          for length, header in zip(payment_lengths, self.PAYMENT_SHEET_HEADERS)]
+
+            ws_payments = None
+            for chunk in chunks:
+                if chunk.empty:
+                    continue
+                if ws_payments is None:
+                    ws_payments = writer.add_sheet("Payment History", self.PAYMENT_SHEET_HEADERS, widths)
+                chunk = self.with_payment_type(chunk)
+                writer.append_frame(ws_payments, chunk, self.PAYMENT_SHEET_COLUMNS, [
+                    'report_text', 'report_text', 'report_money', 'report_center', 'report_text',
+                    lambda value: 'report_manual' if value == 'Manual' else 'report_auto',
+                    'report_center'
+                ])
+
+            if not writer.wb.worksheets:
+                writer.wb.create_sheet("Sheet")
+
+            writer.save(file_path)
             print(f"Excel file saved: {file_path}")
 
         except Exception as e:
@@ -708,6 +3173,136 @@ class AccountingWorkOptimizer:
             raise
 
 
+class PagedTreeview:
+    def __init__(self, parent, columns, fetch, count, format_row, sort, descending=False, page_size=500):
+        # columns: (sort key, heading, width); fetch(sort, descending, search, after, limit) returns rows
+        # whose first value is the row id and last value the sort key
+        self.columns = columns
+        self.fetch = fetch
+        self.count = count
+        self.format_row = format_row
+        self.sort = sort
+        self.descending = descending
+        self.page_size = page_size
+        self.search = ""
+        self.page_starts = [None]
+        self.next_start = None
+        self.total = 0
+        self.search_job = None
+
+        self.frame = ttk.Frame(parent)
+
+        toolbar = ttk.Frame(self.frame)
+        toolbar.pack(fill=tk.X, pady=(0, 5))
+        ttk.Label(toolbar, text="🔍 Search:").pack(side=tk.LEFT)
+        self.search_var = tk.StringVar()
+        search_entry = ttk.Entry(toolbar, textvariable=self.search_var, width=40)
+        search_entry.pack(side=tk.LEFT, padx=5)
+        search_entry.bind('<KeyRelease>', self.schedule_search)
+        search_entry.bind('<Return>', lambda event: self.apply_search())
+
+        self.next_button = ttk.Button(toolbar, text="Next ▶", command=self.next_page)
+        self.next_button.pack(side=tk.RIGHT)
+        self.prev_button = ttk.Button(toolbar, text="◀ Prev", command=self.prev_page)
+        self.prev_button.pack(side=tk.RIGHT, padx=5)
+        self.page_label = ttk.Label(toolbar, text="")
+        self.page_label.pack(side=tk.RIGHT, padx=10)
+
+        headings = [heading for _, heading, _ in columns]
+        self.tree = ttk.Treeview(self.frame, columns=headings, show="headings")
+        for key, heading, width in columns:
+            self.tree.heading(heading, text=heading, command=partial(self.sort_by, key))
+            self.tree.column(heading, width=width)
+
+        scrollbar = ttk.Scrollbar(self.frame, orient=tk.VERTICAL, command=self.tree.yview)
+        self.tree.configure(yscrollcommand=scrollbar.set)
+        scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+
+        self.reload()
+
+    def pack(self, **kwargs):
+        self.frame.pack(**kwargs)
+
+    def reload(self):
+        self.page_starts = [None]
+        self.total = self.count(self.search)
+        self.load()
+
+    def load(self):
+        rows = self.fetch(self.sort, self.descending, self.search, self.page_starts[-1], self.page_size + 1)
+        has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        self.tree.delete(*self.tree.get_children())
+        for row in rows:
+            self.tree.insert("", "end", iid=str(row[0]), values=self.format_row(row))
+
+        self.next_start = (rows[-1][-1], rows[-1][0]) if has_next else None
+        self.update_status()
+
+    def update_status(self):
+        pages = max(1, -(-self.total // self.page_size))
+        self.page_label.config(text=f"Page {len(self.page_starts)} of {pages} | {self.total} rows")
+        self.prev_button.state(['!disabled'] if len(self.page_starts) > 1 else ['disabled'])
+        self.next_button.state(['!disabled'] if self.next_start is not None else ['disabled'])
+
+        for key, heading, _ in self.columns:
+            arrow = (" ▼" if self.descending else " ▲") if key == self.sort else ""
+            self.tree.heading(heading, text=heading + arrow)
+
+    def next_page(self):
+        if self.next_start is not None:
+            self.page_starts.append(self.next_start)
+            self.load()
+
+    def prev_page(self):
+        if len(self.page_starts) > 1:
+            self.page_starts.pop()
+            self.load()
+
+    def sort_by(self, key):
+        if key == self.sort:
+            self.descending = not self.descending
+        else:
+            self.sort = key
+            self.descending = False
+        self.reload()
+
+    def schedule_search(self, event=None):
+        if self.search_job is not None:
+            self.frame.after_cancel(self.search_job)
+        self.search_job = self.frame.after(300, self.apply_search)
+
+    def apply_search(self):
+        self.search_job = None
+        search = self.search_var.get().strip()
+        if search != self.search:
+            self.search = search
+            self.reload()
+
+    def selected(self):
+        selected = self.tree.selection()
+        if not selected:
+            return None, None
+        return selected[0], self.tree.item(selected[0], 'values')
+
+    def update_row(self, item, values):
+        self.tree.item(item, values=values)
+
+    def remove_row(self, item):
+        self.tree.delete(item)
+        self.total = max(0, self.total - 1)
+        if self.tree.get_children():
+            self.update_status()
+        elif self.next_start is not None:
+            self.load()
+        elif len(self.page_starts) > 1:
+            self.prev_page()
+        else:
+            self.update_status()
+
+
 class AccountingOptimizerApp:
     def __init__(self, root):
         self.root = root
@@ -715,6 +3310,7 @@ class AccountingOptimizerApp:
         self.root.geometry("1000x700")
 
         self.optimizer = AccountingWorkOptimizer()
+        self.ingest_running = False
         self.setup_ui()
         self.update_stats()
 
@@ -793,19 +3389,140 @@ class AccountingOptimizerApp:
 
     def process_files(self):
         try:
+            if self.ingest_running:
+                messagebox.showwarning("Processing", "Receipt processing is already running")
+                return
+
             pdf_files = filedialog.askopenfilenames(
                 title="Select PDF Receipt Files",
                 filetypes=[("PDF files", "*.pdf"), ("All files", "*.*")]
             )
 
             if pdf_files:
-                results = self.optimizer.process_pdf_files(pdf_files)
-                result_text = "\n".join(results)
-                messagebox.showinfo("Processing Results", result_text)
-                self.update_stats()
+                try:
+                    import PyPDF2
+                except ImportError:
+                    messagebox.showwarning("Warning", "Install PyPDF2: pip install PyPDF2")
+                    return
+                self.start_ingest(list(pdf_files))
         except Exception as e:
             messagebox.showerror("Error", f"File processing error: {str(e)}")
 
+    def start_ingest(self, pdf_files):
+        window = tk.Toplevel(self.root)
+        window.title("Processing Receipts")
+        window.geometry("900x600")
+
+        progress_var = tk.DoubleVar(value=0)
+        ttk.Progressbar(window, variable=progress_var,
+                        maximum=len(pdf_files)).pack(fill=tk.X, padx=10, pady=(10, 5))
+
+        status_label = ttk.Label(window, text=f"0 / {len(pdf_files)} files", font=('Arial', 10))
+        status_label.pack(fill=tk.X, padx=10)
+
+        tree = ttk.Treeview(window, columns=("File", "Status"), show="headings")
+        tree.heading("File", text="File")
+        tree.heading("Status", text="Status")
+        tree.column("File", width=250)
+        tree.column("Status", width=600)
+        rows = [tree.insert("", "end", values=(os.path.basename(pdf_file), "⏳ Queued"))
+                for pdf_file in pdf_files]
+        tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        button_frame = ttk.Frame(window)
+        button_frame.pack(fill=tk.X, padx=10, pady=10)
+
+        events = queue.Queue()
+        cancel_event = threading.Event()
+        finished = set()
+        started = time.perf_counter()
+
+        def cancel():
+            cancel_event.set()
+            cancel_button.config(state=tk.DISABLED)
+            status_label.config(text="Cancelling...")
+
+        cancel_button = ttk.Button(button_frame, text="⛔ Cancel", command=cancel)
+        cancel_button.pack(side=tk.RIGHT, padx=5)
+
+        def on_close():
+            if self.ingest_running:
+                cancel()
+            else:
+                window.destroy()
+
+        window.protocol("WM_DELETE_WINDOW", on_close)
+
+        def ask_debt(fio):
+            answer = {}
+            ready = threading.Event()
+            events.put(('ask_debt', fio, answer, ready))
+            ready.wait()
+            return answer.get('value')
+
+        def worker():
+            try:
+                results = self.optimizer.process_pdf_files(
+                    pdf_files, bulk=True,
+                    progress=lambda index, result: events.put(('status', index, result)),
+                    cancel_event=cancel_event
+                )
+                events.put(('done', results))
+            except Exception as e:
+                events.put(('error', str(e)))
+
+        def finish(results):
+            self.ingest_running = False
+            self.optimizer.debt_prompt = None
+            elapsed = time.perf_counter() - started
+            counts = {prefix: sum(1 for result in results if result and result.startswith(prefix))
+                      for prefix in ("✅", "⏭️", "⏸️", "❌", "🚫")}
+            status_label.config(text=(
+                f"Done in {elapsed:.1f} s ({len(pdf_files) / max(elapsed, 1e-9):.1f} files/sec) | "
+                f"✅ Added: {counts['✅']} | ⏭️ Duplicates: {counts['⏭️']} | ⏸️ Skipped: {counts['⏸️']} | "
+                f"❌ Errors: {counts['❌']} | 🚫 Cancelled: {counts['🚫']}"
+            ))
+            cancel_button.config(text="Close", state=tk.NORMAL, command=window.destroy)
+            self.update_stats()
+
+        def poll():
+            try:
+                for _ in range(500):
+                    event = events.get_nowait()
+                    kind = event[0]
+                    if kind == 'status':
+                        _, index, result = event
+                        tree.item(rows[index], values=(os.path.basename(pdf_files[index]), result))
+                        finished.add(index)
+                    elif kind == 'ask_debt':
+                        _, fio, answer, ready = event
+                        answer['value'] = self.optimizer.ask_debt_dialog(fio)
+                        ready.set()
+                    elif kind == 'done':
+                        finish(event[1])
+                        return
+                    elif kind == 'error':
+                        self.ingest_running = False
+                        self.optimizer.debt_prompt = None
+                        messagebox.showerror("Error", f"File processing error: {event[1]}")
+                        cancel_button.config(text="Close", state=tk.NORMAL, command=window.destroy)
+                        self.update_stats()
+                        return
+            except queue.Empty:
+                pass
+
+            progress_var.set(len(finished))
+            if not cancel_event.is_set():
+                elapsed = time.perf_counter() - started
+                status_label.config(text=f"{len(finished)} / {len(pdf_files)} files | "
+                                         f"{len(finished) / max(elapsed, 1e-9):.1f} files/sec")
+            self.root.after(100, poll)
+
+        self.ingest_running = True
+        self.optimizer.debt_prompt = ask_debt
+        threading.Thread(target=worker, daemon=True).start()
+        self.root.after(100, poll)
+
     def export_excel(self):
         try:
             if self.optimizer.export_to_excel():
@@ -815,9 +3532,7 @@ class AccountingOptimizerApp:
 
     def manage_clients(self):
         try:
-            clients_df = self.optimizer.get_all_clients()
-
-            if clients_df.empty:
+            if not self.optimizer.count_clients():
                 messagebox.showinfo("Clients", "No clients in database")
                 return
 
@@ -825,41 +3540,29 @@ class AccountingOptimizerApp:
             window.title("Manage Clients")
             window.geometry("900x600")
 
-            tree = ttk.Treeview(window, columns=("ID", "Name", "Phone", "Account", "Debt"), show="headings")
-            tree.heading("ID", text="ID")
-            tree.heading("Name", text="Name")
-            tree.heading("Phone", text="Phone")
-            tree.heading("Account", text="Account")
-            tree.heading("Debt", text="Debt")
-
-            tree.column("ID", width=50)
-            tree.column("Name", width=200)
-            tree.column("Phone", width=150)
-            tree.column("Account", width=100)
-            tree.column("Debt", width=100)
-
-            for _, client in clients_df.iterrows():
-                tree.insert("", "end", values=(
-                    client['client_id'], client['fio'], client['phone'] or "",
-                    client['account'] or "", f"{client['total_debt']:.2f} rub."
-                ))
-
-            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            grid = PagedTreeview(
+                window,
+                [("client_id", "ID", 50), ("fio", "Name", 200), ("phone", "Phone", 150),
+                 ("account", "Account", 100), ("total_debt", "Debt", 100)],
+                self.optimizer.browse_clients, self.optimizer.count_clients,
+                self.client_row_values, sort="fio"
+            )
+            grid.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
 
             button_frame = ttk.Frame(window)
             button_frame.pack(fill=tk.X, padx=10, pady=10)
 
             ttk.Button(button_frame, text="✏️ Edit",
-                       command=lambda: self.edit_client(tree, window)).pack(side=tk.LEFT, padx=5)
+                       command=lambda: self.edit_client(grid, window)).pack(side=tk.LEFT, padx=5)
 
             ttk.Button(button_frame, text="🗑️ Delete",
-                       command=lambda: self.delete_client(tree, window)).pack(side=tk.LEFT, padx=5)
+                       command=lambda: self.delete_client(grid, window)).pack(side=tk.LEFT, padx=5)
 
             ttk.Button(button_frame, text="➕ Add Payment",
-                       command=lambda: self.add_payment_to_client(tree, window)).pack(side=tk.LEFT, padx=5)
+                       command=lambda: self.add_payment_to_client(grid, window)).pack(side=tk.LEFT, padx=5)
 
             ttk.Button(button_frame, text="🎁 Discount",
-                       command=lambda: self.apply_discount_to_client(tree, window)).pack(side=tk.LEFT, padx=5)
+                       command=lambda: self.apply_discount_to_client(grid, window)).pack(side=tk.LEFT, padx=5)
 
             ttk.Button(button_frame, text="Close",
                        command=window.destroy).pack(side=tk.RIGHT, padx=5)
@@ -867,14 +3570,17 @@ class AccountingOptimizerApp:
         except Exception as e:
             messagebox.showerror("Error", f"Client loading error: {str(e)}")
 
-    def edit_client(self, tree, window):
-        selected = tree.selection()
-        if not selected:
+    @staticmethod
+    def client_row_values(row):
+        client_id, fio, phone, account, total_debt = row[:5]
+        return client_id, fio, phone or "", account or "", f"{total_debt:.2f} rub."
+
+    def edit_client(self, grid, window):
+        item, values = grid.selected()
+        if not item:
             messagebox.showwarning("Error", "Select client to edit")
             return
 
-        item = selected[0]
-        values = tree.item(item, 'values')
         client_id = values[0]
 
         client_info = self.optimizer.get_client_info(client_id)
@@ -920,8 +3626,7 @@ class AccountingOptimizerApp:
             if success:
                 messagebox.showinfo("Success", "Client data updated")
                 edit_window.destroy()
-                window.destroy()
-                self.manage_clients()
+                grid.update_row(item, self.client_row_values((client_id, new_fio, new_phone, new_account, new_debt)))
                 self.update_stats()
             else:
                 messagebox.showerror("Error", "Failed to update client data")
@@ -929,14 +3634,12 @@ class AccountingOptimizerApp:
         ttk.Button(edit_window, text="💾 Save",
                    command=save_changes).pack(pady=10)
 
-    def delete_client(self, tree, window):
-        selected = tree.selection()
-        if not selected:
+    def delete_client(self, grid, window):
+        item, values = grid.selected()
+        if not item:
             messagebox.showwarning("Error", "Select client to delete")
             return
 
-        item = selected[0]
-        values = tree.item(item, 'values')
         client_id = values[0]
         client_name = values[1]
 
@@ -949,20 +3652,17 @@ class AccountingOptimizerApp:
             success = self.optimizer.delete_client(client_id)
             if success:
                 messagebox.showinfo("Success", "Client deleted")
-                window.destroy()
-                self.manage_clients()
+                grid.remove_row(item)
                 self.update_stats()
             else:
                 messagebox.showerror("Error", "Failed to delete client")
 
-    def add_payment_to_client(self, tree, window):
-        selected = tree.selection()
-        if not selected:
+    def add_payment_to_client(self, grid, window):
+        item, values = grid.selected()
+        if not item:
             messagebox.showwarning("Error", "Select client for payment")
             return
 
-        item = selected[0]
-        values = tree.item(item, 'values')
         client_id = values[0]
         client_name = values[1]
 
@@ -982,20 +3682,16 @@ class AccountingOptimizerApp:
 
         if success:
             messagebox.showinfo("Success", f"Payment {amount} rub. added for {client_name}")
-            window.destroy()
-            self.manage_clients()
             self.update_stats()
         else:
             messagebox.showerror("Error", "Failed to add payment")
 
-    def apply_discount_to_client(self, tree, window):
-        selected = tree.selection()
-        if not selected:
+    def apply_discount_to_client(self, grid, window):
+        item, values = grid.selected()
+        if not item:
             messagebox.showwarning("Error", "Select client for discount")
             return
 
-        item = selected[0]
-        values = tree.item(item, 'values')
         client_id = values[0]
         client_name = values[1]
 
@@ -1011,15 +3707,14 @@ class AccountingOptimizerApp:
         if new_debt is not None:
             messagebox.showinfo("Success",
                                 f"Discount applied!\n\nClient: {client_name}\nDiscount: {discount:.2f} rub.\nNew debt: {new_debt:.2f} rub.")
-            window.destroy()
-            self.manage_clients()
+            grid.update_row(item, values[:4] + (f"{new_debt:.2f} rub.",))
             self.update_stats()
         else:
             messagebox.showerror("Error", "Failed to apply discount")
 
     def add_manual_payment(self):
         try:
-            clients_df = self.optimizer.get_all_clients()
+            clients_df = self.optimizer.query_clients(['client_id', 'fio'])
 
             if clients_df.empty:
                 messagebox.showinfo("Clients", "No clients in database")
@@ -1075,7 +3770,7 @@ class AccountingOptimizerApp:
 
     def apply_discount(self):
         try:
-            clients_df = self.optimizer.get_all_clients()
+            clients_df = self.optimizer.query_clients(['client_id', 'fio', 'remaining_debt'])
 
             if clients_df.empty:
                 messagebox.showinfo("Clients", "No clients in database")
@@ -1093,7 +3788,7 @@ class AccountingOptimizerApp:
             client_list = []
             self.client_debts = {}
             for _, row in clients_df.iterrows():
-                current_debt = self.optimizer.calculate_remaining_debt(row['client_id'])
+                current_debt = row['remaining_debt']
                 client_str = f"{row['fio']} (Debt: {current_debt:.2f} rub.)"
                 client_list.append(client_str)
                 self.client_debts[client_str] = (row['client_id'], current_debt)
@@ -1151,9 +3846,7 @@ class AccountingOptimizerApp:
 
     def manage_payments(self):
         try:
-            payments_df = self.optimizer.get_all_payments()
-
-            if payments_df.empty:
+            if not self.optimizer.count_payments():
                 messagebox.showinfo("Payments", "No payments in database")
                 return
 
@@ -1161,36 +3854,24 @@ class AccountingOptimizerApp:
             window.title("Manage Payments")
             window.geometry("1000x600")
 
-            tree = ttk.Treeview(window, columns=("ID", "Name", "Amount", "Date", "Bank", "Type"), show="headings")
-            tree.heading("ID", text="ID")
-            tree.heading("Name", text="Name")
-            tree.heading("Amount", text="Amount")
-            tree.heading("Date", text="Date")
-            tree.heading("Bank", text="Bank")
-            tree.heading("Type", text="Type")
-
-            tree.column("ID", width=50)
-            tree.column("Name", width=200)
-            tree.column("Amount", width=100)
-            tree.column("Date", width=100)
-            tree.column("Bank", width=150)
-            tree.column("Type", width=100)
-
-            for _, payment in payments_df.iterrows():
-                payment_type = "Manual" if payment['is_manual'] == 1 else "Auto"
-                tree.insert("", "end", values=(
-                    payment['payment_id'], payment['fio'] or "Unknown",
-                    f"{payment['amount']:.2f} rub.", payment['payment_date'],
-                    payment['bank_name'] or "", payment_type
-                ))
-
-            tree.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            grid = PagedTreeview(
+                window,
+                [("payment_id", "ID", 50), ("fio", "Name", 200), ("amount", "Amount", 100),
+                 ("payment_date", "Date", 100), ("bank_name", "Bank", 150), ("is_manual", "Type", 100)],
+                self.optimizer.browse_payments, self.optimizer.count_payments,
+                self.payment_row_values, sort="payment_date", descending=True
+            )
+            grid.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+            grid.tree.bind('<Double-1>', lambda event: self.show_receipt(grid, window))
 
             button_frame = ttk.Frame(window)
             button_frame.pack(fill=tk.X, padx=10, pady=10)
 
+            ttk.Button(button_frame, text="📄 Receipt",
+                       command=lambda: self.show_receipt(grid, window)).pack(side=tk.LEFT, padx=5)
+
             ttk.Button(button_frame, text="🗑️ Delete",
-                       command=lambda: self.delete_payment(tree, window)).pack(side=tk.LEFT, padx=5)
+                       command=lambda: self.delete_payment(grid, window)).pack(side=tk.LEFT, padx=5)
 
             ttk.Button(button_frame, text="Close",
                        command=window.destroy).pack(side=tk.RIGHT, padx=5)
@@ -1198,14 +3879,41 @@ class AccountingOptimizerApp:
         except Exception as e:
             messagebox.showerror("Error", f"Payments loading error: {str(e)}")
 
-    def delete_payment(self, tree, window):
-        selected = tree.selection()
-        if not selected:
+    @staticmethod
+    def payment_row_values(row):
+        payment_id, fio, amount, payment_date, bank_name, is_manual = row[:6]
+        payment_type = "Manual" if is_manual == 1 else "Auto"
+        return payment_id, fio or "Unknown", f"{amount:.2f} rub.", payment_date, bank_name or "", payment_type
+
+    def show_receipt(self, grid, window):
+        item, values = grid.selected()
+        if not item:
+            messagebox.showwarning("Error", "Select payment to view")
+            return
+
+        # Receipt text is loaded only now, never with the list
+        text = self.optimizer.get_receipt_text(values[0])
+        if not text:
+            messagebox.showinfo("Receipt", "No receipt text stored for this payment")
+            return
+
+        receipt_window = tk.Toplevel(window)
+        receipt_window.title(f"Receipt - payment {values[0]}")
+        receipt_window.geometry("600x500")
+
+        text_widget = tk.Text(receipt_window, wrap=tk.WORD)
+        text_widget.insert('1.0', text)
+        text_widget.config(state=tk.DISABLED)
+        text_widget.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
+
+        ttk.Button(receipt_window, text="Close", command=receipt_window.destroy).pack(pady=5)
+
+    def delete_payment(self, grid, window):
+        item, values = grid.selected()
+        if not item:
             messagebox.showwarning("Error", "Select payment to delete")
             return
 
-        item = selected[0]
-        values = tree.item(item, 'values')
         payment_id = values[0]
 
         confirm = messagebox.askyesno(
@@ -1217,14 +3925,340 @@ class AccountingOptimizerApp:
             success = self.optimizer.delete_payment(payment_id)
             if success:
                 messagebox.showinfo("Success", "Payment deleted")
-                window.destroy()
-                self.manage_payments()
+                grid.remove_row(item)
                 self.update_stats()
             else:
                 messagebox.showerror("Error", "Failed to delete payment")
 
 
+def collect_pdf_files(paths):
+    pdf_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            pdf_files.extend(sorted(
+                file_path for file_path in glob.glob(os.path.join(path, '*'))
+                if file_path.lower().endswith('.pdf') and os.path.isfile(file_path)
+            ))
+        else:
+            pdf_files.append(path)
+    return pdf_files
+
+
+class FolderWatcher:
+    ARCHIVED_PREFIXES = ("✅", "⏭️", "⏳")
+
+    def __init__(self, optimizer, folder, interval=5.0, archive_dir=None, bulk=True,
+                 metrics_file=None, profile=None):
+        self.optimizer = optimizer
+        self.folder = folder
+        self.interval = interval
+        self.archive_dir = archive_dir
+        self.bulk = bulk
+        self.metrics_file = metrics_file
+        self.profile = profile
+        self.last_seen = {}
+        self.processed = set()
+
+    def scan(self, require_stable=True):
+        ready = []
+        current = {}
+        for pdf_file in collect_pdf_files([self.folder]):
+            try:
+                stat = os.stat(pdf_file)
+            except OSError:
+                continue
+            signature = (stat.st_size, stat.st_mtime)
+            current[pdf_file] = signature
+            if (pdf_file, signature) in self.processed:
+                continue
+            # A file is picked up once its size and mtime stop changing between polls
+            if not require_stable or self.last_seen.get(pdf_file) == signature:
+                ready.append(pdf_file)
+        self.last_seen = current
+        return ready
+
+    def process(self, pdf_files):
+        results = self.optimizer.process_pdf_files(pdf_files, bulk=self.bulk, profile=self.profile)
+        for pdf_file, result in zip(pdf_files, results):
+            print(result)
+            self.processed.add((pdf_file, self.last_seen.get(pdf_file)))
+            if self.archive_dir and result.startswith(self.ARCHIVED_PREFIXES):
+                self.archive(pdf_file)
+        if self.optimizer.last_profile:
+            print(self.optimizer.last_profile)
+        if self.metrics_file:
+            self.optimizer.metrics.write(self.metrics_file)
+        return results
+
+    def archive_path(self, pdf_file):
+        # Banking apps export every receipt as e.g. "Чек по операции.pdf"; number repeats
+        # ("Чек по операции (1).pdf") instead of replacing the receipt archived before
+        name, extension = os.path.splitext(os.path.basename(pdf_file))
+        target = os.path.join(self.archive_dir, name + extension)
+        counter = 0
+        while os.path.exists(target):
+            counter += 1
+            target = os.path.join(self.archive_dir, f"{name} ({counter}){extension}")
+        return target
+
+    def archive(self, pdf_file):
+        try:
+            os.makedirs(self.archive_dir, exist_ok=True)
+            os.replace(pdf_file, self.archive_path(pdf_file))
+        except OSError as e:
+            print(f"Archive error: {e}")
+
+    def run(self, once=False):
+        print(f"Watching {self.folder} (every {self.interval:g} s)")
+        try:
+            while True:
+                ready = self.scan(require_stable=not once)
+                if ready:
+                    self.process(ready)
+                if once:
+                    return
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            print("Watch stopped")
+
+
+def load_benchmarks():
+    # The benchmark suite in benchmarks/ is a development tool next to this file; copies deployed
+    # without it (or with an unrelated "benchmarks" package on sys.path) just have no bench command
+    try:
+        from benchmarks import harness
+    except ImportError:
+        return None
+    return harness
+
+
+def build_cli_parser():
+    parser = argparse.ArgumentParser(description="Accounting Work Optimizer (headless mode)")
+    parser.add_argument('--db', default="receipts_database.db", help="SQLite database file")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def add_ingest_options(command):
+        command.add_argument('--workers', type=int, default=None, help="PDF extraction processes")
+        command.add_argument('--serial', action='store_true', help="commit each receipt separately")
+        command.add_argument('--new-clients', choices=('default', 'pending', 'skip'), default='pending',
+                             help="what to do with receipts from unknown clients")
+        command.add_argument('--default-debt', type=float, default=1000.0,
+                             help="total debt for new clients with --new-clients default")
+        command.add_argument('--match-threshold', type=float, default=0.85,
+                             help="minimum name similarity (0-1) for matching an existing client")
+        command.add_argument('--max-pages', type=int, default=10, help="read at most this many pages per PDF")
+        command.add_argument('--full-text', action='store_true',
+                             help="read every page instead of stopping once name, amount and date are found")
+        command.add_argument('--ocr-workers', type=int, default=2,
+                             help="concurrent OCR jobs for scanned PDFs (0 disables; needs tesseract and pdftoppm)")
+        command.add_argument('--ocr-timeout', type=float, default=60, help="seconds allowed per OCR page")
+        command.add_argument('--ocr-lang', default="rus+eng", help="tesseract languages")
+        command.add_argument('--metrics', help="write per-stage timings after each batch (*.prom: Prometheus, else JSON)")
+        command.add_argument('--profile', choices=('cprofile', 'tracemalloc'), help="profile each batch")
+
+    ingest = commands.add_parser('ingest', help="process PDF receipts")
+    ingest.add_argument('paths', nargs='+', help="PDF files or folders")
+    add_ingest_options(ingest)
+
+    watch = commands.add_parser('watch', help="process PDFs as they land in a folder")
+    watch.add_argument('folder')
+    watch.add_argument('--interval', type=float, default=5.0, help="seconds between folder scans")
+    watch.add_argument('--archive-dir', help="move ingested PDFs here")
+    watch.add_argument('--once', action='store_true', help="process the folder once and exit")
+    add_ingest_options(watch)
+
+    export = commands.add_parser('export', help="write the Excel report")
+    export.add_argument('output')
+
+    archive = commands.add_parser('archive', help="append new payments to a Parquet archive partitioned by month")
+    archive.add_argument('directory')
+    archive.add_argument('--full', action='store_true', help="discard the archive and export everything again")
+
+    stats = commands.add_parser('stats', help="print database statistics")
+    stats.add_argument('--by', choices=('bank', 'month'), help="break payments down by bank or month")
+    stats.add_argument('--rebuild', action='store_true', help="recount statistics from the payments table")
+
+    payments = commands.add_parser('payments', help="list payments matching filters")
+    payments.add_argument('--client', type=int, help="client id")
+    payments.add_argument('--from', dest='date_from', help="first day (YYYY-MM-DD or DD.MM.YYYY) or month (YYYY-MM)")
+    payments.add_argument('--to', dest='date_to', help="last day or month")
+    payments.add_argument('--bank')
+    payments.add_argument('--manual', action='store_true', default=None, help="manual payments only")
+    payments.add_argument('--auto', dest='manual', action='store_false', help="receipt payments only")
+    payments.add_argument('--min-amount', type=float)
+    payments.add_argument('--max-amount', type=float)
+    payments.add_argument('--columns', nargs='+', default=['payment_id', 'payment_date', 'fio', 'amount', 'bank_name'])
+    payments.add_argument('--limit', type=int, default=100, help="rows to print (0: all)")
+    payments.add_argument('--csv', help="write every matching payment to this CSV file instead, in chunks")
+
+    reconcile = commands.add_parser('reconcile', help="payment totals for a date range")
+    reconcile.add_argument('date_from', help="first day (YYYY-MM-DD or DD.MM.YYYY) or month (YYYY-MM)")
+    reconcile.add_argument('date_to', nargs='?', help="last day or month (default: same as date_from)")
+    reconcile.add_argument('--by', choices=('day', 'month', 'bank'), default='month')
+    reconcile.add_argument('--list', action='store_true', help="also print the individual payments")
+
+    balances = commands.add_parser('balances', help="verify or rebuild client balances")
+    balances.add_argument('--rebuild', action='store_true')
+
+    pending = commands.add_parser('pending', help="review receipts from unknown clients")
+    pending_actions = pending.add_subparsers(dest='action', required=True)
+    pending_actions.add_parser('list')
+    approve = pending_actions.add_parser('approve')
+    approve.add_argument('pending_id', type=int)
+    approve.add_argument('--debt', type=float, required=True, help="total debt for the new client")
+    discard = pending_actions.add_parser('discard')
+    discard.add_argument('pending_id', type=int)
+
+    harness = load_benchmarks()
+    if harness is not None:
+        bench = commands.add_parser('bench', help="benchmark extraction, ingest and export on synthetic receipts")
+        harness.add_arguments(bench)
+        bench.set_defaults(run_bench=harness.run)
+
+    return parser
+
+
+def run_cli(argv=None):
+    args = build_cli_parser().parse_args(argv)
+
+    if args.command == 'bench':
+        return args.run_bench(args)
+
+    optimizer = AccountingWorkOptimizer(
+        args.db,
+        extraction_workers=getattr(args, 'workers', None),
+        headless=True,
+        new_client_policy=getattr(args, 'new_clients', 'pending'),
+        default_debt=getattr(args, 'default_debt', 1000.0),
+        match_threshold=getattr(args, 'match_threshold', 0.85),
+        max_pdf_pages=getattr(args, 'max_pages', 10),
+        lazy_extraction=not getattr(args, 'full_text', False),
+        ocr_workers=getattr(args, 'ocr_workers', 2),
+        ocr_page_timeout=getattr(args, 'ocr_timeout', 60),
+        ocr_languages=getattr(args, 'ocr_lang', "rus+eng")
+    )
+    try:
+        if args.command == 'ingest':
+            pdf_files = collect_pdf_files(args.paths)
+            started = time.perf_counter()
+            results = optimizer.process_pdf_files(pdf_files, bulk=not args.serial, profile=args.profile)
+            for result in results:
+                print(result)
+            elapsed = time.perf_counter() - started
+            print(f"{len(pdf_files)} files in {elapsed:.1f} s ({len(pdf_files) / max(elapsed, 1e-9):.1f} files/sec)")
+            for line in optimizer.metrics.summary():
+                print(line)
+            if optimizer.last_profile:
+                print(optimizer.last_profile)
+            if args.metrics:
+                optimizer.metrics.write(args.metrics)
+            return 1 if any(result.startswith("❌") for result in results) else 0
+
+        if args.command == 'watch':
+            FolderWatcher(optimizer, args.folder, args.interval, args.archive_dir, bulk=not args.serial,
+                          metrics_file=args.metrics, profile=args.profile).run(once=args.once)
+            return 0
+
+        if args.command == 'export':
+            if not optimizer.export_report(args.output):
+                print("No data to export")
+                return 1
+            return 0
+
+        if args.command == 'archive':
+            try:
+                appended, state = optimizer.export_parquet(args.directory, full=args.full)
+            except RuntimeError as e:
+                print(e)
+                return 1
+            print(f"Archived {appended} new payments (watermark: payment {state['payment_id']}, "
+                  f"{state.get('rows', 0)} rows in archive)")
+            return 0
+
+        if args.command == 'stats':
+            if args.rebuild:
+                print(f"Rebuilt statistics for {optimizer.rebuild_statistics()} bank/month groups")
+            total_clients, total_payments, total_amount = optimizer.get_database_stats()
+            print(f"Clients: {total_clients}")
+            print(f"Payments: {total_payments}")
+            print(f"Amount: {total_amount:,.2f} rub.")
+            print(f"Pending receipts: {len(optimizer.get_pending_receipts())}")
+            if args.by:
+                breakdown = optimizer.get_payment_breakdown(args.by)
+                print(breakdown.to_string(index=False) if not breakdown.empty else "No payments")
+            return 0
+
+        if args.command == 'payments':
+            filters = dict(client_id=args.client, date_from=args.date_from, date_to=args.date_to, bank=args.bank,
+                           manual=args.manual, amount_min=args.min_amount, amount_max=args.max_amount)
+            try:
+                if args.csv:
+                    written = 0
+                    for chunk in optimizer.query_payments(args.columns, chunksize=50000, **filters):
+                        chunk[args.columns].to_csv(args.csv, mode='a' if written else 'w', header=not written,
+                                                   index=False)
+                        written += len(chunk)
+                    print(f"{written} payments written to {args.csv}")
+                    return 0
+                frame = optimizer.query_payments(args.columns, limit=args.limit or None, **filters)
+            except ValueError as e:
+                print(e)
+                return 2
+            print(frame[args.columns].to_string(index=False) if not frame.empty else "No payments")
+            return 0
+
+        if args.command == 'reconcile':
+            date_to = args.date_to or args.date_from
+            try:
+                totals = optimizer.get_payment_totals_between(args.date_from, date_to, args.by)
+            except ValueError as e:
+                print(e)
+                return 2
+            if args.list:
+                payments = optimizer.get_payments_between(args.date_from, date_to)
+                if not payments.empty:
+                    print(payments[['payment_id', 'payment_date', 'fio', 'amount', 'bank_name']].to_string(index=False))
+            print(totals.to_string(index=False) if not totals.empty else "No payments")
+            return 0
+
+        if args.command == 'balances':
+            if args.rebuild:
+                print(f"Rebuilt balances for {optimizer.rebuild_client_balances()} clients")
+                return 0
+            mismatches = optimizer.verify_client_balances()
+            for mismatch in mismatches:
+                print(f"Client {mismatch['client_id']}: stored {mismatch['stored']}, actual {mismatch['actual']}")
+            print(f"{len(mismatches)} mismatched balances")
+            return 1 if mismatches else 0
+
+        if args.command == 'pending':
+            if args.action == 'list':
+                pending = optimizer.get_pending_receipts()
+                print(pending.to_string(index=False) if not pending.empty else "No pending receipts")
+                return 0
+            if args.action == 'approve':
+                client_id = optimizer.approve_pending_receipt(args.pending_id, args.debt)
+                if client_id is None:
+                    print(f"Pending receipt {args.pending_id} not found")
+                    return 1
+                print(f"Payment booked for client {client_id} "
+                      f"(remaining: {optimizer.calculate_remaining_debt(client_id):.2f} rub.)")
+                return 0
+            if args.action == 'discard':
+                if not optimizer.discard_pending_receipt(args.pending_id):
+                    print(f"Pending receipt {args.pending_id} not found")
+                    return 1
+                return 0
+    finally:
+        optimizer.close()
+
+    return 0
+
+
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(run_cli(sys.argv[1:]))
+
     try:
         import pandas as pd
         import sqlite3
@@ -1236,4 +4270,5 @@ if __name__ == "__main__":
 
     root = tk.Tk()
     app = AccountingOptimizerApp(root)
-    root.mainloop()
\ No newline at end of file
+    root.mainloop()
+    app.optimizer.close()
\ No newline at end of file
@@ -0,0 +1,20 @@
+import importlib.util
+import os
+import sys
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Analysis of bank checks.py")
+
+
+def load_app():
+    # The app file name has spaces, so it is loaded by path; when it is already running
+    # (python main.py bench) the running module is reused instead of executing it twice
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, '__file__', None)
+        if module_file and os.path.abspath(module_file) == APP_PATH:
+            return module
+
+    spec = importlib.util.spec_from_file_location("bank_checks", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,15 @@
+import argparse
+import sys
+
+from benchmarks import harness
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks",
+                                     description="Benchmark extraction, ingest and export on synthetic receipts")
+    harness.add_arguments(parser)
+    return harness.run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,159 @@
+import json
+import os
+import platform
+import re
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks import load_app
+from benchmarks.synthetic import populate_synthetic_database, synthetic_receipt_texts, write_synthetic_pdfs
+
+app = load_app()
+
+
+BENCHMARK_CASES = ('extract', 'pdf', 'ingest', 'export')
+
+
+def benchmark_extraction(analyzer, texts, repeat=5):
+    texts = list(texts)
+    if not texts:
+        return {}
+
+    timings = {}
+    for label, compiled in (('uncompiled', False), ('compiled', True)):
+        best = None
+        for _ in range(repeat):
+            re.purge()
+            started = time.perf_counter()
+            for text in texts:
+                analyzer.extract_entities(text, compiled=compiled)
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        timings[label] = best / len(texts) * 1e6
+
+    return {
+        'receipts': len(texts),
+        'uncompiled_us_per_receipt': timings['uncompiled'],
+        'compiled_us_per_receipt': timings['compiled'],
+        'speedup': timings['uncompiled'] / timings['compiled'] if timings['compiled'] else 0.0,
+    }
+
+
+def timed(function, *args, **kwargs):
+    started = time.perf_counter()
+    result = function(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def benchmark_result(case, scale, seconds, **extra):
+    return dict(case=case, scale=scale, seconds=round(seconds, 4),
+                per_second=round(scale / seconds, 1) if seconds else None, **extra)
+
+
+def run_benchmarks(scales=(1000,), cases=BENCHMARK_CASES, workdir=None, repeat=3, workers=None):
+    workdir = workdir or tempfile.mkdtemp(prefix="receipt_bench_")
+    os.makedirs(workdir, exist_ok=True)
+    results = []
+
+    for scale in scales:
+        print(f"Scale {scale}...")
+        if 'extract' in cases:
+            timings = benchmark_extraction(app.ReceiptAnalyzer(), synthetic_receipt_texts(scale), repeat=repeat)
+            results.append(benchmark_result(
+                'extract', scale, timings['compiled_us_per_receipt'] * scale / 1e6,
+                us_per_receipt=round(timings['compiled_us_per_receipt'], 2),
+                uncompiled_us_per_receipt=round(timings['uncompiled_us_per_receipt'], 2)))
+
+        if 'pdf' in cases or 'ingest' in cases:
+            seconds, pdf_files = timed(write_synthetic_pdfs, os.path.join(workdir, f"pdfs_{scale}"), scale)
+            print(f"  {len(pdf_files)} synthetic PDFs ready ({seconds:.1f} s)")
+
+        if 'pdf' in cases:
+            seconds, texts = timed(lambda: [app.read_pdf_text(pdf_file) for pdf_file in pdf_files])
+            results.append(benchmark_result('pdf', scale, seconds,
+                                            empty=sum(1 for text in texts if not text.strip())))
+
+        if 'ingest' in cases:
+            db_file = os.path.join(workdir, f"ingest_{scale}.db")
+            for path in (db_file, f"{os.path.splitext(db_file)[0]}_extraction_cache.db"):
+                if os.path.exists(path):
+                    os.remove(path)
+            optimizer = app.AccountingWorkOptimizer(db_file, extraction_workers=workers, headless=True,
+                                                    new_client_policy='default', default_debt=100000.0)
+            try:
+                seconds, ingest_results = timed(optimizer.process_pdf_files, pdf_files, bulk=True)
+                results.append(benchmark_result(
+                    'ingest', scale, seconds,
+                    ok=sum(1 for result in ingest_results if result.startswith("✅")),
+                    failed=sum(1 for result in ingest_results if result.startswith("❌"))))
+            finally:
+                optimizer.close()
+
+        if 'export' in cases:
+            db_file = os.path.join(workdir, f"export_{scale}.db")
+            if os.path.exists(db_file):
+                os.remove(db_file)
+            optimizer = app.AccountingWorkOptimizer(db_file, headless=True)
+            try:
+                populate_synthetic_database(optimizer, scale)
+                report_file = os.path.join(workdir, f"report_{scale}.xlsx")
+                seconds, exported = timed(optimizer.export_report, report_file)
+                results.append(benchmark_result('export', scale, seconds,
+                                                bytes=os.path.getsize(report_file) if exported else 0))
+            finally:
+                optimizer.close()
+
+        for result in results:
+            if result['scale'] == scale:
+                print(f"  {result['case']:<8} {result['seconds']:>10.3f} s  {result['per_second'] or 0:>10.1f} /s")
+
+    return {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'parser_version': app.ReceiptAnalyzer.PARSER_VERSION,
+        'workdir': workdir,
+        'results': results,
+    }
+
+
+def compare_benchmarks(report, baseline, tolerance=0.2):
+    # Returns the (case, scale) pairs whose throughput fell more than `tolerance` below the baseline
+    previous = {(result['case'], result['scale']): result for result in baseline.get('results', [])}
+    regressions = []
+    for result in report['results']:
+        before = previous.get((result['case'], result['scale']))
+        if not before or not before.get('per_second') or not result.get('per_second'):
+            continue
+        change = result['per_second'] / before['per_second'] - 1
+        print(f"  {result['case']:<8} {result['scale']:>7}  {change:+.1%} vs baseline")
+        if change < -tolerance:
+            regressions.append((result['case'], result['scale']))
+    return regressions
+
+
+def add_arguments(bench):
+    bench.add_argument('--scales', type=int, nargs='+', default=[1000], help="receipt counts, e.g. 1000 10000 100000")
+    bench.add_argument('--cases', nargs='+', choices=BENCHMARK_CASES, default=list(BENCHMARK_CASES))
+    bench.add_argument('--repeat', type=int, default=3, help="repetitions for the extraction case (best is kept)")
+    bench.add_argument('--workers', type=int, default=None, help="PDF extraction processes for the ingest case")
+    bench.add_argument('--workdir', help="where synthetic PDFs and databases go (default: a temp folder)")
+    bench.add_argument('--output', default="bench_results.json", help="JSON results file")
+    bench.add_argument('--compare', help="earlier results file; exit 1 if any case got slower than --tolerance")
+    bench.add_argument('--tolerance', type=float, default=0.2, help="allowed throughput drop (0.2 = 20%%)")
+
+
+def run(args):
+    report = run_benchmarks(args.scales, args.cases, args.workdir, args.repeat, args.workers)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            regressions = compare_benchmarks(report, json.load(f), args.tolerance)
+        for case, scale in regressions:
+            print(f"Regression: {case} at {scale}")
+        return 1 if regressions else 0
+    return 0
@@ -0,0 +1,147 @@
+import os
+import random
+
+from benchmarks import load_app
+
+app = load_app()
+
+
+SYNTHETIC_SURNAMES = ['Иванов', 'Петров', 'Сидоров', 'Смирнов', 'Кузнецов', 'Попов', 'Соколов', 'Лебедев',
+                      'Козлов', 'Новиков', 'Морозов', 'Волков', 'Алексеев', 'Фёдоров', 'Егоров', 'Павлов']
+SYNTHETIC_NAMES = ['Александр', 'Сергей', 'Дмитрий', 'Андрей', 'Алексей', 'Максим', 'Иван', 'Артём',
+                   'Михаил', 'Николай', 'Павел', 'Олег']
+SYNTHETIC_PATRONYMICS = ['Александрович', 'Сергеевич', 'Дмитриевич', 'Андреевич', 'Иванович', 'Петрович',
+                         'Михайлович', 'Николаевич']
+SYNTHETIC_MONTHS = ['января', 'февраля', 'марта', 'апреля', 'мая', 'июня', 'июля', 'августа',
+                    'сентября', 'октября', 'ноября', 'декабря']
+
+
+def synthetic_receipt_texts(count, seed=0, clients=None):
+    # Sber-style transfer receipts; every other one spells the month out, as parse_date must handle both
+    rng = random.Random(seed)
+    clients = clients or max(1, count // 10)
+    people = [
+        (f"{rng.choice(SYNTHETIC_SURNAMES)} {rng.choice(SYNTHETIC_NAMES)} {rng.choice(SYNTHETIC_PATRONYMICS)}",
+         f"+7 9{rng.randint(10, 99)} {rng.randint(100, 999)}-{rng.randint(10, 99)}-{rng.randint(10, 99)}",
+         f"{rng.randint(0, 9999):04d}")
+        for _ in range(clients)
+    ]
+
+    for index in range(count):
+        fio, phone, account = rng.choice(people)
+        day, month, year = rng.randint(1, 28), rng.randint(1, 12), rng.randint(2022, 2025)
+        if index % 2:
+            date_line = f"{day} {SYNTHETIC_MONTHS[month - 1]} {year} в {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        else:
+            date_line = f"{day:02d}.{month:02d}.{year} {rng.randint(0, 23):02d}:{rng.randint(0, 59):02d}"
+        rubles = rng.randint(100, 150000)
+        amount = f"{rubles:,}".replace(",", " ") + f",{rng.randint(0, 99):02d}"
+
+        yield (
+            "СберБанк Онлайн\n"
+            "Чек по операции\n"
+            f"{date_line}\n"
+            "Перевод клиенту СберБанка\n"
+            "ФИО получателя\n"
+            "Анна Викторовна К.\n"
+            f"Номер карты получателя **** {rng.randint(0, 9999):04d}\n"
+            "ФИО отправителя\n"
+            f"{fio}\n"
+            f"Телефон отправителя {phone}\n"
+            f"Счёт отправителя **** {account}\n"
+            "Сумма перевода\n"
+            f"{amount} ₽\n"
+            "Комиссия\n"
+            "0,00 ₽\n"
+            f"Номер документа {rng.randint(10 ** 9, 10 ** 10 - 1)}\n"
+        )
+
+
+def pdf_escape(data):
+    return data.replace(b'\\', b'\\\\').replace(b'(', b'\\(').replace(b')', b'\\)')
+
+
+def write_text_pdf(file_path, text):
+    # Minimal PDF, one page per form feed in `text`. Non-ASCII characters get single-byte codes
+    # from 128 up and a ToUnicode map, so text extraction returns the original text without a font
+    codes = {}
+    contents = []
+    for page_text in text.split("\f"):
+        lines = []
+        for line in page_text.split("\n"):
+            encoded = bytearray()
+            for char in line:
+                if ord(char) < 128:
+                    encoded.append(ord(char))
+                else:
+                    if char not in codes:
+                        codes[char] = 128 + len(codes)
+                    encoded.append(codes[char])
+            lines.append(bytes(encoded))
+        contents.append(b"BT /F1 10 Tf 14 TL 40 800 Td\n" + b"".join(
+            b"(" + pdf_escape(line) + b") Tj T*\n" for line in lines) + b"ET\n")
+
+    ascii_map = "".join(f"<{code:02X}> <{code:04X}>\n" for code in range(32, 127))
+    extra_map = "".join(f"<{code:02X}> <{ord(char):04X}>\n" for char, code in codes.items())
+    cmap = (
+        "/CIDInit /ProcSet findresource begin 12 dict begin begincmap\n"
+        "/CMapName /Synthetic def /CMapType 2 def\n"
+        "1 begincodespacerange <00> <FF> endcodespacerange\n"
+        f"{95 + len(codes)} beginbfchar\n{ascii_map}{extra_map}endbfchar\n"
+        "endcmap CMapName currentdict /CMap defineresource pop end end\n"
+    ).encode('ascii')
+
+    page_numbers = [5 + 2 * index for index in range(len(contents))]
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+            b" ".join(b"%d 0 R" % number for number in page_numbers), len(contents)),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /ToUnicode 4 0 R >>",
+        b"<< /Length %d >>\nstream\n" % len(cmap) + cmap + b"endstream",
+    ]
+    for number, content in zip(page_numbers, contents):
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % (number + 1))
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"endstream")
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    output += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+
+    with open(file_path, 'wb') as f:
+        f.write(output)
+
+
+def write_synthetic_pdfs(folder, count, seed=0):
+    os.makedirs(folder, exist_ok=True)
+    pdf_files = []
+    for index, text in enumerate(synthetic_receipt_texts(count, seed)):
+        file_path = os.path.join(folder, f"receipt_{index:06d}.pdf")
+        if not os.path.exists(file_path):
+            write_text_pdf(file_path, text)
+        pdf_files.append(file_path)
+    return pdf_files
+
+
+def populate_synthetic_database(optimizer, count, seed=0):
+    analyzer = optimizer.analyzer
+    with optimizer.db.transaction() as conn:
+        client_ids = {}
+        rows = []
+        texts = []
+        for index, text in enumerate(synthetic_receipt_texts(count, seed)):
+            data = analyzer.extract_entities(text)
+            key = (data['fio'], data.get('phone', ''), data.get('account', ''))
+            if key not in client_ids:
+                client_ids[key] = optimizer.insert_client(conn, *key, 100000.0)
+            rows.append(optimizer.payment_row(
+                client_ids[key], data['amount'], data['date'], data['bank'], f"synthetic-{seed}-{index}",
+                fingerprint=app.receipt_fingerprint(data)))
+            texts.append(text)
+        optimizer.insert_payments(conn, rows, texts)
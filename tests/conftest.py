@@ -0,0 +1,14 @@
+import importlib.util
+import os
+
+import pytest
+
+APP_PATH = os.path.join(os.path.dirname(__file__), os.pardir, "Analysis of bank checks.py")
+
+
+@pytest.fixture(scope="session")
+def app():
+    spec = importlib.util.spec_from_file_location("bank_checks", APP_PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,43 @@
+import pytest
+
+
+@pytest.fixture
+def index(app):
+    return app.ClientIndex().load([
+        (1, "Петров Иван Сергеевич", "+7 912 345-67-89", "40817810000000001234", 1000.0),
+        (2, "Павлов Иван Сергеевич", "", "", 2000.0),
+        (3, "Сидорова Анна Петровна", "", "", 500.0),
+    ])
+
+
+def test_exact_name_matches(index):
+    assert index.resolve("Сидорова Анна Петровна") == (3, 500.0)
+    assert index.resolve("сидорова  анна петровна") == (3, 500.0)
+
+
+def test_trigram_match_tolerates_a_typo(index):
+    assert index.resolve("Сидорова Ана Петровна") == (3, 500.0)
+
+
+def test_initials_match_a_single_client(index):
+    assert index.resolve("Сидорова А. П.") == (3, 500.0)
+
+
+def test_initials_shared_by_two_clients_resolve_to_nobody(index):
+    # Sber prints the sender as "Имя Отчество Ф."; Петров and Павлов both fit
+    assert index.resolve("Иван Сергеевич П.") is None
+
+
+def test_matching_identifier_breaks_a_tie(index):
+    assert index.resolve("Иван Сергеевич П.", phone="+7 912 345-67-89") == (1, 1000.0)
+    assert index.resolve("Иван Сергеевич П.", account="**** 1234") == (1, 1000.0)
+
+
+def test_single_words_never_match(index):
+    assert index.resolve("Иван") is None
+    assert index.resolve("Сергеевич") is None
+
+
+def test_threshold_above_initials_score_disables_initials(app, index):
+    index.threshold = app.INITIALS_SCORE + 0.05
+    assert index.resolve("Сидорова А. П.") is None
@@ -0,0 +1,44 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+@pytest.fixture
+def receipt_pdf(app, tmp_path):
+    from benchmarks import synthetic
+    text = next(synthetic.synthetic_receipt_texts(1))
+    pdf_file = str(tmp_path / "receipt.pdf")
+    synthetic.write_text_pdf(pdf_file, text + "\fВторая страница\fТретья страница")
+    return pdf_file
+
+
+def extract(app, db_file, pdf_file, **options):
+    optimizer = app.AccountingWorkOptimizer(db_file, headless=True, ocr_workers=0, extraction_workers=1, **options)
+    try:
+        return [text for _, _, _, text in optimizer.iter_extracted([pdf_file])][0]
+    finally:
+        optimizer.close()
+
+
+def test_lazy_text_is_not_served_to_a_full_read(app, tmp_path, receipt_pdf):
+    db_file = str(tmp_path / "receipts.db")
+    lazy = extract(app, db_file, receipt_pdf)
+    assert "Вторая страница" not in lazy
+
+    full = extract(app, db_file, receipt_pdf, lazy_extraction=False)
+    assert "Третья страница" in full
+
+    capped = extract(app, db_file, receipt_pdf, lazy_extraction=False, max_pdf_pages=2)
+    assert "Вторая страница" in capped and "Третья страница" not in capped
+
+    # The same settings are still answered from the cache
+    optimizer = app.AccountingWorkOptimizer(db_file, headless=True, ocr_workers=0, lazy_extraction=False,
+                                            max_pdf_pages=2)
+    try:
+        list(optimizer.iter_extracted([receipt_pdf]))
+        assert optimizer.extraction_cache.hits == 1
+    finally:
+        optimizer.close()
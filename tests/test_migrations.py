@@ -0,0 +1,136 @@
+import sqlite3
+import zlib
+
+import pytest
+
+
+def make_baseline_database(path):
+    # Schema and data as written by the original release: no user_version, DD.MM.YYYY dates, REAL rubles
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE clients (
+            client_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            fio TEXT NOT NULL,
+            phone TEXT,
+            account TEXT,
+            total_debt REAL DEFAULT 0,
+            created_date TEXT
+        );
+        CREATE TABLE payments (
+            payment_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            client_id INTEGER,
+            amount REAL NOT NULL,
+            payment_date TEXT NOT NULL,
+            receipt_text TEXT,
+            bank_name TEXT,
+            created_date TEXT,
+            FOREIGN KEY (client_id) REFERENCES clients (client_id)
+        );
+    ''')
+    conn.executemany(
+        "INSERT INTO clients (fio, phone, account, total_debt, created_date) VALUES (?, ?, ?, ?, ?)",
+        [
+            ("Петров Иван Сергеевич", "", "", 1000.0, "01.02.2024 10:00:00"),
+            ("Сидорова Анна Петровна", "", "", 500.5, "01.02.2024 10:00:00"),
+            ("Козлов Олег", "", "", 0.0, "01.02.2024 10:00:00"),
+        ]
+    )
+    conn.executemany(
+        "INSERT INTO payments (client_id, amount, payment_date, receipt_text, bank_name, created_date) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (1, 100.1, "05.02.2024", "Сбербанк чек 1", "Сбербанк", "05.02.2024 12:00:00"),
+            (1, 200.2, "28.01.2024", "Сбербанк чек 2", "Сбербанк", "28.01.2024 12:00:00"),
+            (1, 0.7, "15.12.2023", "Т-Банк чек", "Т-Банк", "15.12.2023 12:00:00"),
+            (2, 250.25, "03.03.2024", "ВТБ чек", "ВТБ", "03.03.2024 12:00:00"),
+            (2, 19.99, "не дата", None, "ВТБ", "07.03.2024 09:30:00"),
+        ]
+    )
+    conn.commit()
+    conn.close()
+
+
+@pytest.fixture
+def upgraded(app, tmp_path):
+    db_file = str(tmp_path / "receipts_database.db")
+    make_baseline_database(db_file)
+    optimizer = app.AccountingWorkOptimizer(db_file, headless=True, extraction_cache_size=0, ocr_workers=0)
+    yield optimizer
+    optimizer.close()
+
+
+def test_baseline_database_reaches_current_schema(app, upgraded):
+    assert upgraded.schema_version() == len(app.AccountingWorkOptimizer.SCHEMA_MIGRATIONS)
+    cursor = upgraded.db.connect().cursor()
+    assert 'receipt_text' not in upgraded.table_columns(cursor, 'payments')
+    assert {'amount_kopecks', 'file_hash', 'is_manual', 'receipt_fingerprint'} <= \
+        upgraded.table_columns(cursor, 'payments')
+
+
+def test_baseline_rows_keep_dates_and_amounts(upgraded):
+    cursor = upgraded.db.connect().cursor()
+    cursor.execute("SELECT payment_id, client_id, amount_kopecks, amount, payment_date, bank_name "
+                   "FROM payments ORDER BY payment_id")
+    assert cursor.fetchall() == [
+        (1, 1, 10010, 100.1, "2024-02-05", "Сбербанк"),
+        (2, 1, 20020, 200.2, "2024-01-28", "Сбербанк"),
+        (3, 1, 70, 0.7, "2023-12-15", "Т-Банк"),
+        (4, 2, 25025, 250.25, "2024-03-03", "ВТБ"),
+        # Unparseable dates fall back to the day the payment was recorded
+        (5, 2, 1999, 19.99, "2024-03-07", "ВТБ"),
+    ]
+
+
+def test_baseline_receipt_texts_move_to_side_table(upgraded):
+    cursor = upgraded.db.connect().cursor()
+    cursor.execute("SELECT payment_id, body FROM receipt_texts ORDER BY payment_id")
+    texts = {payment_id: zlib.decompress(body).decode("utf-8") for payment_id, body in cursor.fetchall()}
+    assert texts == {1: "Сбербанк чек 1", 2: "Сбербанк чек 2", 3: "Т-Банк чек", 4: "ВТБ чек"}
+    assert upgraded.get_receipt_text(4) == "ВТБ чек"
+
+
+def test_baseline_balances_are_rebuilt(upgraded):
+    assert upgraded.verify_client_balances() == []
+    cursor = upgraded.db.connect().cursor()
+    cursor.execute("SELECT client_id, paid_kopecks, payment_count, last_payment_date, remaining_debt "
+                   "FROM client_balances ORDER BY client_id")
+    assert cursor.fetchall() == [
+        (1, 30100, 3, "2024-02-05", pytest.approx(699.0)),
+        (2, 27024, 2, "2024-03-07", pytest.approx(230.26)),
+        (3, 0, 0, None, 0.0),
+    ]
+
+
+def test_baseline_statistics_are_rebuilt(upgraded):
+    cursor = upgraded.db.connect().cursor()
+    query = "SELECT bank_name, month, payment_count, amount_kopecks FROM payment_stats ORDER BY bank_name, month"
+    cursor.execute(query)
+    stored = cursor.fetchall()
+    assert stored == [
+        ("ВТБ", "2024-03", 2, 27024),
+        ("Сбербанк", "2024-01", 1, 20020),
+        ("Сбербанк", "2024-02", 1, 10010),
+        ("Т-Банк", "2023-12", 1, 70),
+    ]
+    upgraded.rebuild_statistics()
+    cursor.execute(query)
+    assert cursor.fetchall() == stored
+    assert cursor.execute("SELECT value FROM stat_counters WHERE name = 'clients'").fetchone() == (3,)
+
+
+def test_migrations_are_append_only(app, upgraded, tmp_path):
+    # A database stopped at the old payment_stats version still carries the DD.MM.YYYY layout
+    db_file = str(tmp_path / "stepwise.db")
+    make_baseline_database(db_file)
+    upgraded.db = app.DatabaseConnectionManager(db_file)
+    upgraded.migrate_database(app.AccountingWorkOptimizer.SCHEMA_MIGRATIONS.index('migration_payment_stats') + 1)
+    cursor = upgraded.db.connect().cursor()
+    assert cursor.execute("SELECT payment_date FROM payments WHERE payment_id = 1").fetchone() == ("05.02.2024",)
+    assert cursor.execute("SELECT paid_total, last_payment_date FROM client_balances WHERE client_id = 1"
+                          ).fetchone() == (pytest.approx(301.0), "05.02.2024")
+    assert cursor.execute("SELECT amount_total FROM payment_stats WHERE bank_name = 'ВТБ' AND month = '2024-03'"
+                          ).fetchone() == (pytest.approx(250.25),)
+
+    upgraded.migrate_database()
+    assert upgraded.verify_client_balances() == []
+    upgraded.db.close_all()